@@ -4,11 +4,19 @@ import csv
 import json
 from distutils import dir_util
 import random
+import re
+import sys
+import time
 from sys import argv
 from collections import OrderedDict
 import argparse
 from pathlib import Path
 
+try:
+    import resource  # POSIX only; peak RSS is skipped elsewhere
+except ImportError:
+    resource = None
+
 csvName = 'Public.csv'
 groupColumn = 'Institution'
 ordinals = []
@@ -62,6 +70,7 @@ parser.add_argument(
 args = parser.parse_args(argv[3:])
 
 print(f"Using {csvName} file and '{groupColumn}' as Group")
+buildStart = time.perf_counter()
 
 # === Canonical order for CorrosionRegionType (can be overridden via --corr-order) ===
 CORR_FIELD = 'CorrosionRegionType'
@@ -74,7 +83,6 @@ DEFAULT_CORR_ORDER = [
     "F (Inland Tropical)"
 ]
 CORR_ORDER = args.corr_order if args.corr_order else DEFAULT_CORR_ORDER
-corr_index = {name: i for i, name in enumerate(CORR_ORDER)}
 
 # Normalisation map (handles case/spaces/minor variants)
 # Keys are lowercased/stripped; values are canonical labels above.
@@ -102,84 +110,118 @@ dir_util.mkpath(str(baseDir))
 dir_util.copy_tree('./template', str(baseDir))
 print(f"Copied files to folder {path}..")
 
-groups = []
+groups = {}  # insertion-ordered set of group values
+domains = {}  # ordinal column -> insertion-ordered set of its values
 firstRow = {}
+rowCount = 0
 
 files_dir = baseDir / 'files'
 files_dir.mkdir(parents=True, exist_ok=True)
+data_js_path = files_dir / 'data.js'
+
+def normalise_row(row, fieldnames):
+    """Normalise CorrosionRegionType and return the row in header order."""
+    if CORR_FIELD in row and row[CORR_FIELD] is not None:
+        key = str(row[CORR_FIELD]).strip().lower()
+        row[CORR_FIELD] = corr_normalise.get(key, row[CORR_FIELD])
+
+    # Preserve header order -> OrderedDict
+    od = OrderedDict()
+    for field in fieldnames:
+        od[field] = row.get(field, "")
+    return od
+
+def write_row(jsonfile, od):
+    json.dump(od, jsonfile, ensure_ascii=False)
+    jsonfile.write(',\n')
+
+def detect_ordinals(row):
+    """Determine ordinals (unless forced) from the first row's values."""
+    for key, value in row.items():
+        try:
+            if args.ordinals and key in args.ordinals:
+                print("Ordinal (Forced)", key, value)
+                ordinals.append(key)
+            elif args.cardinals and key in args.cardinals:
+                print("Cardinal (Forced)", key, value)
+                # do not append to ordinals
+            else:
+                float(value)
+                print("Cardinal", key, value)
+        except (ValueError, TypeError):
+            print("Ordinal", key, value)
+            ordinals.append(key)
 
-# === Read CSV, normalise corrosion labels, buffer rows, then sort by CORR_ORDER ===
-buffered_rows = []
-with open(csvName, 'r', encoding='utf-8-sig', newline='') as csvfile:
+    # Ensure corrosion field is treated as ordinal
+    if CORR_FIELD not in ordinals:
+        ordinals.append(CORR_FIELD)
+
+def domain_order(column, values):
+    """Axis order for an ordinal column: CORR_ORDER for the corrosion field
+    (unknown labels after it), order of first appearance for the rest."""
+    if column != CORR_FIELD:
+        return list(values)
+    known = [label for label in CORR_ORDER if label in values]
+    return known + [label for label in values if label not in known]
+
+# === Read CSV, normalise corrosion labels and write data.js ===
+# Rows go straight to data.js in source order, so memory stays flat
+# regardless of input size. Ordinal axes get their category order from
+# `dataDomains` (written after the rows) rather than from row order.
+with open(csvName, 'r', encoding='utf-8-sig', newline='') as csvfile, \
+     open(data_js_path, 'w', encoding='utf-8') as jsonfile:
     reader = csv.DictReader(csvfile)
     print(reader.fieldnames)
+    jsonfile.write('var dataJSON = [\n')
 
     for row in reader:
         if not firstRow:
             firstRow = dict(row)  # snapshot original types
+            detect_ordinals(firstRow)
+            domains = {key: {} for key in ordinals if key in reader.fieldnames}
 
         # Collect unique group values
-        gval = row.get(groupColumn, '')
-        if gval not in groups:
-            groups.append(gval)
-
-        # Normalise CorrosionRegionType (case-insensitive)
-        if CORR_FIELD in row and row[CORR_FIELD] is not None:
-            key = str(row[CORR_FIELD]).strip().lower()
-            row[CORR_FIELD] = corr_normalise.get(key, row[CORR_FIELD])
-
-        # Preserve header order -> OrderedDict
-        od = OrderedDict()
-        for field in reader.fieldnames:
-            od[field] = row.get(field, "")
-        buffered_rows.append(od)
-
-# Sort rows so the first occurrence order of categories follows CORR_ORDER
-# (Helps D3 ordinal axes that infer domain order from data appearance.)
-def corr_sort_key(r):
-    label = r.get(CORR_FIELD, "")
-    return corr_index.get(label, 9999)  # unknowns at end
-
-buffered_rows.sort(key=corr_sort_key)
-
-# Write data.js
-data_js_path = files_dir / 'data.js'
-with open(data_js_path, 'w', encoding='utf-8') as jsonfile:
-    jsonfile.write('var dataJSON = [\n')
-    for od in buffered_rows:
-        json.dump(od, jsonfile, ensure_ascii=False)
-        jsonfile.write(',\n')
-    jsonfile.write('];\n')
+        groups.setdefault(row.get(groupColumn, ''), None)
+        rowCount += 1
 
-print(f"Wrote new json file {data_js_path}")
+        od = normalise_row(row, reader.fieldnames)
+        for key, values in domains.items():
+            value = od.get(key, '')
+            if value != 'null':
+                values.setdefault(value, None)
+        write_row(jsonfile, od)
 
-def replace_in_file(filename: Path, placeholder: str, replacement: str):
-    """Simple placeholder replacement using pure Python (cross-platform)."""
+    jsonfile.write('];\n')
+    domains = {key: domain_order(key, values) for key, values in domains.items()}
+    jsonfile.write(f'var dataDomains = {json.dumps(domains, ensure_ascii=False)};\n')
+
+groups = list(groups)
+print(f"Wrote new json file {data_js_path} ({rowCount} rows, {len(groups)} groups)")
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def print_report(rows, seconds):
+    """Print the wall-clock / peak-RSS summary for a build."""
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"Build report: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak RSS: {rss:.1f} MB")
+
+def render_file(filename: Path, replacements: dict):
+    """Substitute every placeholder in one pass and write the file once."""
     p = Path(filename)
     text = p.read_text(encoding='utf-8')
-    text = text.replace(placeholder, replacement)
+    pattern = '|'.join(re.escape(k) for k in sorted(replacements, key=len, reverse=True))
+    text = re.sub(rf'(?<!\w)(?:{pattern})(?!\w)', lambda m: replacements[m.group()], text)
     p.write_text(text, encoding='utf-8')
 
-# Determine ordinals automatically (unless forced), based on first row
-for key, value in firstRow.items():
-    try:
-        if args.ordinals and key in args.ordinals:
-            print("Ordinal (Forced)", key, value)
-            ordinals.append(key)
-        elif args.cardinals and key in args.cardinals:
-            print("Cardinal (Forced)", key, value)
-            # do not append to ordinals
-        else:
-            float(value)
-            print("Cardinal", key, value)
-    except (ValueError, TypeError):
-        print("Ordinal", key, value)
-        ordinals.append(key)
-
-# Ensure corrosion field is treated as ordinal
-if CORR_FIELD not in ordinals:
-    ordinals.append(CORR_FIELD)
-
 print("Excluding:")
 if args.excludes:
     excludes = args.excludes
@@ -202,13 +244,18 @@ ordinals_js = json.dumps(ordinals)
 excludes_js = json.dumps(excludes if excludes else [])
 
 # Do replacements
-replace_in_file(index_html, '_COLOURS_', colors_js)
-replace_in_file(index_html, '_TITLE_', Path(path).name)
-replace_in_file(index_html, '_GROUPS_', groups_js)
-replace_in_file(index_html, '_GROUP_', group_name)
-
-replace_in_file(pc_js, '_ORDINALS_', ordinals_js)
-replace_in_file(pc_js, '_EXCLUDES_', excludes_js)
-replace_in_file(pc_js, '_GROUP_', group_name)
+render_file(index_html, {
+    '_COLOURS_': colors_js,
+    '_TITLE_': Path(path).name,
+    '_GROUPS_': groups_js,
+    '_GROUP_': group_name,
+})
+
+render_file(pc_js, {
+    '_ORDINALS_': ordinals_js,
+    '_EXCLUDES_': excludes_js,
+    '_GROUP_': group_name,
+})
 
 print("Saved to: " + str(baseDir))
+print_report(rowCount, time.perf_counter() - buildStart)
@@ -177,11 +177,14 @@
         var excludes = _EXCLUDES_;
         var ex = d != "id" && (excludes.indexOf(d) < 0);
 
-        // ordinal categories
+        // ordinal categories, in the order build.py wrote to dataDomains
+        // (older builds: order of first appearance in the rows)
         if (_ORDINALS_.indexOf(d) >= 0) {
+          var domain = (window.dataDomains && dataDomains[d]) ||
+            myData.map(function(p) { return p[d]; }).filter(z => z !== 'null');
           return ex &&
           (y[d] = d3.scalePoint()
-            .domain(myData.map(function(p) { return p[d]; }).filter(z => z !== 'null'))
+            .domain(domain)
             .range([h, 0]));
         }
 
@@ -1,77 +1,1095 @@
+import argparse
+import array
 import csv
+import hashlib
+import heapq
 import json
-from distutils import dir_util
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
 import random
-from sys import argv
+import re
+import sys
+import time
 from pathlib import Path
 
+try:
+    import resource          # POSIX only; peak RSS is skipped elsewhere
+except ImportError:
+    resource = None
+
+try:
+    import numpy as np       # optional; speeds up the density tiles
+except ImportError:
+    np = None
+
 # ── Locate script & template dirs ───────────────────────────────────────────────
 SCRIPT_DIR   = Path(__file__).parent
 TEMPLATE_DIR = SCRIPT_DIR / 'template'
 
+# Above this many rows 'auto' draws lines on a canvas instead of as SVG paths
+CANVAS_ROWS = 2000
+
+# Equal-width bins per numeric column in files/stats.js
+HISTOGRAM_BINS = 20
+
+# Text columns with more categories than this get no counts in stats.js;
+# the page counts them itself when it needs to
+STATS_CATEGORIES = 1000
+
+# Bins per numeric axis in the pairwise tiles of the density renderer
+DENSITY_BINS = 32
+
+# Density tiles are split by group up to this many groups (the page colours
+# groups from a 12-colour palette); with more, each pair gets one tile
+DENSITY_GROUPS = 12
+
+# Pairs with a text axis of more categories than this (one left unbucketed
+# by --format rows or --max-categories 0) get no density tile
+DENSITY_CATEGORIES = 100
+
+# Columns the page places rows on the map with, in order of preference
+# (must match guessLatLon in template/index.html)
+LAT_FIELDS = ['Latitude', 'LAT', 'Lat', 'lat']
+LON_FIELDS = ['Longitude', 'LONGITUDE', 'Long', 'Lng', 'lon', 'lng']
+
+# Map clusters: square cells of CLUSTER_CELL screen pixels, precomputed for
+# zoom levels 0..CLUSTER_ZOOM (see template/files/clusters.js)
+CLUSTER_CELL = 64
+CLUSTER_ZOOM = 7
+
+# Positional defaults; filled in after parsing, so that a CSV given without
+# a group column can be told apart from no arguments at all
+DEFAULT_CSV   = 'parallel_coord.csv'
+DEFAULT_GROUP = 'AMSAssetRef'
+
 # Command-line arguments
-csvName     = 'parallel_coord.csv'
-groupColumn = 'AMSAssetRef'
-excludes    = []
+parser = argparse.ArgumentParser(
+    usage="%(prog)s <csv file> <group Column name> [columns to omit, ...] [options]",
+    epilog="Example: %(prog)s Public.csv 'Institution' 'name'",
+)
+parser.add_argument('csv', nargs='?',
+                    help=f'CSV file, next to this script (default: {DEFAULT_CSV})')
+parser.add_argument('group', nargs='?',
+                    help=f'Column to group (colour) rows by (default: {DEFAULT_GROUP})')
+parser.add_argument('excludes', nargs='*', default=[],
+                    help='Columns to omit generating axes for (they stay in the grid and export)')
+parser.add_argument('--drop', action='append', default=[], metavar='COLUMN',
+                    help="leave a column out of the build altogether: it is skipped while "
+                         "reading the CSV and never written to data.js (repeatable)")
+parser.add_argument('--format', choices=['columnar', 'rows'], default='columnar',
+                    help="data.js layout: 'columnar' (one array per column, ordinal columns "
+                         "dictionary-encoded) or 'rows' (one JSON object per row)")
+parser.add_argument('--binary', action='store_true',
+                    help="with --format columnar, write each column as a little-endian "
+                         "Float32/Int32 .bin file plus a JSON manifest in files/data/")
+parser.add_argument('--index', action='store_true',
+                    help="with --format columnar, also write a sorted row index per numeric "
+                         "column and posting lists per ordinal column for brush filtering "
+                         "(otherwise the page builds them on load)")
+parser.add_argument('--renderer', choices=['auto', 'svg', 'canvas', 'density'], default='auto',
+                    help="how the page draws lines: one SVG path per row, or batched onto a "
+                         f"canvas; 'auto' picks canvas above {CANVAS_ROWS} rows. 'density' draws "
+                         "shaded bands between neighbouring axes instead, for millions of rows")
+parser.add_argument('--vendor', choices=['link', 'shared'], default='link',
+                    help="where pages load the hashed vendor libraries from: 'link' hardlinks "
+                         "them into each output's files/ folder, 'shared' loads them from the "
+                         "common vendor/ folder when dashboards are served from their parent")
+parser.add_argument('--shard-rows', type=int, default=0, metavar='N',
+                    help="with --format columnar, split the data into files/shards/ of N rows "
+                         "each; the page draws the first shard at once and streams in the rest")
+parser.add_argument('--sample', type=int, default=0, metavar='N',
+                    help="store a sample of about N rows, stratified by the group column; while "
+                         "more than N rows pass the brushes the canvas renderer draws only those")
+parser.add_argument('--precision', type=int, default=None, metavar='N',
+                    help="round numbers to N decimal places in data.js and stats.js (default: "
+                         "as many as the CSV has); smaller files, coarser axes")
+parser.add_argument('--quantize', action='append', default=[], metavar='COLUMN=STEP',
+                    help="snap a numeric column to multiples of STEP before writing, e.g. "
+                         "--quantize Depth=0.5 (repeatable)")
+parser.add_argument('--group-by', action='append', default=[], metavar='COLUMN',
+                    help="also let the page switch the colour grouping to COLUMN from a "
+                         "dropdown, without a rebuild (repeatable)")
+parser.add_argument('--max-categories', type=int, default=50, metavar='N',
+                    help="text axes with more than N distinct values show the N-1 most common "
+                         "and fold the rest into 'Other' (0: never); the grid and export keep "
+                         "the original values")
+parser.add_argument('--infer-rows', type=int, default=1000, metavar='N',
+                    help="infer column types from the first N rows, or from every row with 0 "
+                         "(types are cached in <csv name>.schema.json next to the CSV)")
+parser.add_argument('--max-text-share', type=float, default=0.05, metavar='SHARE',
+                    help="a numeric column with text past the inferred rows stays numeric while "
+                         "at most this share of its non-blank cells is text: those cells are left "
+                         "off the axis and kept as text for the grid and export. Above it, the "
+                         "column is made categorical (default: 0.05)")
+parser.add_argument('--force', action='store_true',
+                    help='ignore the build cache in the output folder and rebuild everything')
+parser.add_argument('--name',
+                    help='output folder name, next to the builder folder (default: CSV file name)')
+parser.add_argument('--batch', metavar='MANIFEST',
+                    help="build every view listed in a JSON manifest instead: a list of objects "
+                         "with the keys above, e.g. [{\"csv\": \"a.csv\", \"group\": \"State\", "
+                         "\"name\": \"a_state\", \"excludes\": [\"id\"]}]; other options given "
+                         "with --batch (e.g. --force) apply to every view")
+parser.add_argument('--jobs', type=int, default=None,
+                    help='with --batch, number of worker processes (default: one per CPU)')
+
+
+# ── Column types ────────────────────────────────────────────────────────────────
+# Cells treated as blanks when inferring types (case-insensitive)
+MISSING = {'', 'na', 'n/a', 'nan', 'null', 'none', '-'}
+
+# A text column is high-cardinality when it has more than HIGH_CARDINALITY
+# distinct values making up more than HIGH_CARDINALITY_SHARE of its
+# non-blank cells, or reaches DISTINCT_LIMIT distinct values at all
+HIGH_CARDINALITY       = 100
+HIGH_CARDINALITY_SHARE = 0.5
+DISTINCT_LIMIT         = 10000
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_path(csvPath):
+    return csvPath.with_name(csvPath.stem + '.schema.json')
+
+
+def infer_schema(csvPath, sampleRows):
+    """Column types from the first `sampleRows` rows (0: every row).
+
+    Blanks are ignored, so one empty or odd cell no longer decides a
+    column's type. Each column is one of
+      integer           every non-blank cell is a whole number
+      numeric           every non-blank cell is a number
+      categorical       text with few distinct values
+      high-cardinality  text that is mostly unique (ids, names, ...)
+    Distinct values are only counted up to DISTINCT_LIMIT, so a full scan
+    runs in constant memory.
+    """
+    columns, rows = {}, 0
+    with open(csvPath, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for name in reader.fieldnames or []:
+            columns[name] = {'numeric': True, 'integral': True, 'values': 0, 'distinct': set()}
+        for row in reader:
+            if sampleRows and rows >= sampleRows:
+                break
+            rows += 1
+            for name, column in columns.items():
+                value = (row[name] or '').strip()
+                if value.lower() in MISSING:
+                    continue
+                column['values'] += 1
+                distinct = column['distinct']
+                if len(distinct) < DISTINCT_LIMIT:
+                    distinct.add(value)
+                if column['numeric']:
+                    try:
+                        number = float(value)
+                    except ValueError:
+                        column['numeric'] = column['integral'] = False
+                        continue
+                    if column['integral'] and not number.is_integer():
+                        column['integral'] = False
+
+    types = {}
+    for name, column in columns.items():
+        distinct = len(column['distinct'])
+        if column['values'] and column['numeric']:
+            types[name] = 'integer' if column['integral'] else 'numeric'
+        elif distinct >= DISTINCT_LIMIT or (distinct > HIGH_CARDINALITY and
+                                            distinct > HIGH_CARDINALITY_SHARE * column['values']):
+            types[name] = 'high-cardinality'
+        else:
+            types[name] = 'categorical'
+    return {'rows': rows, 'types': types}
+
+
+def load_schema(csvPath, sampleRows):
+    """Column types for a CSV, cached in <csv name>.schema.json next to it.
+
+    The cache is reused while the CSV's hash and the sample size match; its
+    size/mtime let unchanged files skip even the hash. Editing the types
+    in the file overrides the inference for later builds.
+    """
+    stat = csvPath.stat()
+    try:
+        cached = json.loads(schema_path(csvPath).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        cached = {}
+    source = cached.get('source', {})
+    if cached.get('sample') == sampleRows:
+        if source.get('size') == stat.st_size and source.get('mtime') == stat.st_mtime_ns:
+            return cached
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': file_digest(csvPath)}
+    if cached.get('sample') == sampleRows and cached.get('source', {}).get('sha256') == source['sha256']:
+        schema = dict(cached, source=source)
+    else:
+        print(f"Inferring column types from {'every row' if not sampleRows else f'{sampleRows} rows'}")
+        schema = dict(infer_schema(csvPath, sampleRows), source=source, sample=sampleRows)
+
+    save_schema(csvPath, schema)
+    return schema
+
+
+def save_schema(csvPath, schema):
+    write_atomic(schema_path(csvPath),
+                 lambda partial: partial.write_text(json.dumps(schema, indent=1), encoding='utf-8'))
+
+
+def write_atomic(target, write):
+    """Create `target` by calling `write` on a temporary path next to it,
+    then renaming that into place, so parallel batch builds never see half
+    a file."""
+    partial = target.with_name(f'.{target.name}.{os.getpid()}')
+    write(partial)
+    os.replace(partial, target)
+
+
+def print_schema(schema):
+    print("Detected column types:")
+    for name, kind in schema['types'].items():
+        print(f"  {kind:<17} {name}")
+
+
+# ── data.js writers ─────────────────────────────────────────────────────────────
+def json_number(value):
+    """A numeric cell as a JSON value: int when integral, None when unparseable."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number):
+        return None
+    if number.is_integer() and abs(number) < 2 ** 53:
+        return int(number)
+    return number
+
+
+def number_token(value):
+    """JSON token for a numeric cell; anything unparseable becomes null."""
+    number = json_number(value)
+    return 'null' if number is None else repr(number)
+
+
+def group_value(value, ordinal):
+    """A group column's cell as the browser sees it: numbers lose their CSV
+    spelling ("40.0" -> 40) once they are emitted as JSON numbers."""
+    if ordinal:
+        return value
+    token = number_token(value)
+    return '' if token == 'null' else token
+
+
+def parse_quantize(specs):
+    """{column: step} from --quantize COLUMN=STEP options."""
+    steps = {}
+    for spec in specs:
+        name, _, step = spec.rpartition('=')
+        try:
+            steps[name] = float(step)
+        except ValueError:
+            name = ''
+        if not name or not steps[name] > 0:
+            raise ValueError(f"--quantize expects COLUMN=STEP with a positive STEP, got {spec!r}")
+    return steps
+
+
+def decimals(step):
+    """Decimal places needed to write multiples of `step` exactly (0.25 -> 2)."""
+    return max(0, -Decimal(repr(step)).normalize().as_tuple().exponent)
+
+
+def build_index(values, ordinal, categories=0):
+    """Row ids sorted for range lookups in the page's brush filter.
+
+    Numeric columns: ids of every non-NaN row ordered by value.
+    Ordinal columns: ids grouped by code (a counting sort), plus `offsets`
+    so that code c owns order[offsets[c]:offsets[c + 1]].
+    Returns (order, offsets); offsets is None for numeric columns.
+    """
+    if not ordinal:
+        ids = [i for i, v in enumerate(values) if v == v]
+        ids.sort(key=values.__getitem__)
+        return array.array('i', ids), None
+
+    offsets = [0] * (categories + 1)
+    for code in values:
+        offsets[code + 1] += 1
+    for c in range(categories):
+        offsets[c + 1] += offsets[c]
+    cursor = offsets[:-1]
+    order  = array.array('i', bytes(4 * len(values)))
+    for i, code in enumerate(values):
+        order[cursor[code]] = i
+        cursor[code] += 1
+    return order, offsets
+
+
+def encode(column, value):
+    """Dictionary code of an ordinal value, counting how often each is used."""
+    code = column['domain'].setdefault(value, len(column['domain']))
+    counts = column['counts']
+    if code == len(counts):
+        counts.append(1)
+    else:
+        counts[code] += 1
+    return code
+
+
+def bucket_axis(domain, counts, limit):
+    """Axis categories for an ordinal column with more than `limit` values.
+
+    The limit - 1 most frequent values keep their own category (in
+    dictionary order) and the rest share one "Other (n)" category, so the
+    page never draws thousands of ticks. Returns {domain, codes} where
+    codes[c] is the axis category of dictionary code c, or None when the
+    column fits (or limit is 0). The raw values stay in the dictionary for
+    the grid and export.
+    """
+    if not limit or len(domain) <= limit:
+        return None
+    keep = sorted(sorted(range(len(domain)), key=counts.__getitem__, reverse=True)[:limit - 1])
+    codes = [len(keep)] * len(domain)
+    for category, code in enumerate(keep):
+        codes[code] = category
+    return {'domain': [domain[c] for c in keep] + [f'Other ({len(domain) - len(keep)})'],
+            'codes': codes}
+
+
+class RowWriter:
+    """Legacy layout: `var dataJSON = [{...}, ...]`, one object per row."""
+
+    def __init__(self, view, out, fieldnames, ordinals):
+        self.view     = view
+        self.out      = out
+        self.ordinals = ordinals
+        out.write('var dataJSON = [')
+
+    def group_key(self, row):
+        group = self.view.group
+        return group_value(row[group], group in self.ordinals)
+
+    def write(self, row):
+        json.dump({name: value if name in self.ordinals else json_number(value)
+                   for name, value in row.items()}, self.out)
+        self.out.write(',\n')
+
+    def close(self, rows, texts):
+        self.out.write('];\n')
+        self.out.write(f'var dataOrdinals = {json.dumps(self.ordinals)};\n')
+        if texts:
+            self.out.write(f'var dataTexts = {json.dumps(texts)};\n')
+
+    def discard(self):
+        pass
+
+
+class ColumnarWriter:
+    """Columnar layout: `var dataColumns = {length, columns: [...]}`.
+
+    Numeric columns become plain number arrays, ordinal columns become
+    integer codes into a per-column dictionary (`domain`). Text cells of a
+    numeric column are written as null in the array and by row id in its
+    `text` (see Build.coerce). Each column is
+    streamed to its own temporary file while reading, then the files are
+    concatenated, so memory only grows with the size of the dictionaries.
+    """
+
+    def __init__(self, view, out, fieldnames, ordinals):
+        self.view    = view
+        self.out     = out
+        self.tmp     = tempfile.TemporaryDirectory()
+        self.columns = []
+        for n, name in enumerate(fieldnames):
+            column = {
+                'name':    name,
+                'ordinal': name in ordinals,
+                'domain':  {},
+                'counts':  [],
+                'file':    open(Path(self.tmp.name) / f'{n}.txt', 'w', encoding='utf-8'),
+                'sep':     '',
+            }
+            self.columns.append(column)
+
+    def token(self, column, value):
+        if column['ordinal']:
+            return str(encode(column, value))
+        return number_token(value)
+
+    def group_key(self, row):
+        group = self.view.group
+        for column in self.columns:
+            if column['name'] == group:
+                return group_value(row[group], column['ordinal'])
+        return row[group]
+
+    def write(self, row):
+        for column in self.columns:
+            column['file'].write(column['sep'] + self.token(column, row[column['name']]))
+            column['sep'] = ','
+
+    def close(self, rows, texts):
+        out = self.out
+        out.write(f'var dataColumns = {{"length": {rows}, "columns": [\n')
+        for n, column in enumerate(self.columns):
+            column['file'].close()
+            head = {'name': column['name'], 'type': 'ordinal' if column['ordinal'] else 'numeric'}
+            if column['ordinal']:
+                head['domain'] = list(column['domain'])
+                axis = bucket_axis(head['domain'], column['counts'], self.view.max_categories)
+                if axis:
+                    head['axis'] = axis
+            elif column['name'] in texts:
+                head['text'] = texts[column['name']]
+            out.write(json.dumps(head)[:-1])
+            out.write(', "codes": [' if column['ordinal'] else ', "values": [')
+            with open(column['file'].name, encoding='utf-8') as part:
+                shutil.copyfileobj(part, out)
+            out.write(']')
+            if self.view.index:
+                self.write_index(column)
+            out.write('}' + (',\n' if n < len(self.columns) - 1 else '\n'))
+        out.write(']};\n')
+        self.tmp.cleanup()
+
+    def discard(self):
+        """Close and delete the staged columns of a pass that is read again."""
+        for column in self.columns:
+            column['file'].close()
+        self.tmp.cleanup()
+
+    def write_index(self, column):
+        with open(column['file'].name, encoding='utf-8') as part:
+            text = part.read()
+        tokens = text.split(',') if text else []
+        if column['ordinal']:
+            values = [int(t) for t in tokens]
+        else:
+            values = [math.nan if t == 'null' else float(t) for t in tokens]
+        order, offsets = build_index(values, column['ordinal'], len(column['domain']))
+        self.out.write(', "order": ' + json.dumps(order.tolist()))
+        if offsets is not None:
+            self.out.write(', "offsets": ' + json.dumps(offsets))
+
+
+class ShardedWriter(ColumnarWriter):
+    """Columnar layout split into files/shards/<k>.js of --shard-rows rows.
+
+    data.js only describes the columns (names, types, dictionaries) and
+    lists the shards. Each shard passes its slice of every column to
+    ColumnStore.chunk(), so the page can draw the first shard straight
+    away and load the rest in idle time. Dictionary codes are global, so a
+    shard never depends on another shard. Only one shard is held in memory.
+    """
+
+    def __init__(self, view, out, fieldnames, ordinals):
+        self.view     = view
+        self.out      = out
+        self.shardDir = view.outDir / 'files' / 'shards'
+        shutil.rmtree(self.shardDir, ignore_errors=True)
+        self.shardDir.mkdir(parents=True)
+        self.shards   = []
+        self.rows     = 0
+        self.pending  = 0
+        self.columns  = [{'name': name, 'ordinal': name in ordinals, 'domain': {}, 'counts': [], 'tokens': []}
+                         for name in fieldnames]
+
+    def write(self, row):
+        for column in self.columns:
+            column['tokens'].append(self.token(column, row[column['name']]))
+        self.rows    += 1
+        self.pending += 1
+        if self.pending >= self.view.shard_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        name = f'files/shards/{len(self.shards)}.js'
+        with open(self.view.outDir / name, 'w', encoding='utf-8') as shard:
+            shard.write(f'ColumnStore.chunk({{"offset": {self.rows - self.pending}, '
+                        f'"length": {self.pending}, "columns": [\n')
+            shard.write(',\n'.join('[' + ','.join(column['tokens']) + ']' for column in self.columns))
+            shard.write(']});\n')
+        for column in self.columns:
+            del column['tokens'][:]
+        self.shards.append(name)
+        self.pending = 0
+
+    def close(self, rows, texts):
+        self.flush()
+        heads = []
+        for column in self.columns:
+            head = {'name': column['name'], 'type': 'ordinal' if column['ordinal'] else 'numeric'}
+            if column['ordinal']:
+                head['domain'] = list(column['domain'])
+                axis = bucket_axis(head['domain'], column['counts'], self.view.max_categories)
+                if axis:
+                    head['axis'] = axis
+            elif column['name'] in texts:
+                head['text'] = texts[column['name']]
+            heads.append(head)
+        manifest = {'length': rows, 'shards': self.shards, 'columns': heads}
+        self.out.write(f'var dataShards = {json.dumps(manifest)};\n')
+
+    def discard(self):
+        shutil.rmtree(self.shardDir, ignore_errors=True)
+
+
+class BinaryWriter:
+    """Columnar layout split into raw typed-array sidecars.
+
+    Every column is written to files/data/<n>.bin as little-endian values
+    the page can wrap in a typed array without copying: Int32 codes for
+    ordinal columns, Int32 for numeric columns that only hold whole numbers
+    (and no blanks), Float32 otherwise. files/data/manifest.json describes
+    the columns and data.js only points the page at the manifest.
+    """
+
+    CHUNK = 1 << 16
+
+    def __init__(self, view, out, fieldnames, ordinals):
+        self.view    = view
+        self.out     = out
+        self.dataDir = view.outDir / 'files' / 'data'
+        shutil.rmtree(self.dataDir, ignore_errors=True)
+        self.dataDir.mkdir(parents=True)
+        self.tmp     = tempfile.TemporaryDirectory()
+        self.columns = []
+        for n, name in enumerate(fieldnames):
+            ordinal = name in ordinals
+            self.columns.append({
+                'name':     name,
+                'ordinal':  ordinal,
+                'domain':   {},
+                'counts':   [],
+                'integral': True,
+                'buffer':   array.array('i' if ordinal else 'd'),
+                # ordinal codes are final; numbers are staged as float64
+                'file':     open((self.dataDir if ordinal else Path(self.tmp.name)) / f'{n}.bin', 'wb'),
+            })
+
+    group_key = ColumnarWriter.group_key
+    discard   = ColumnarWriter.discard
+
+    def write(self, row):
+        for column in self.columns:
+            value = row[column['name']]
+            if column['ordinal']:
+                column['buffer'].append(encode(column, value))
+            else:
+                try:
+                    number = float(value)
+                except ValueError:
+                    number = math.nan
+                if column['integral'] and not (number.is_integer() and -2 ** 31 <= number < 2 ** 31):
+                    column['integral'] = False
+                column['buffer'].append(number)
+            if len(column['buffer']) >= self.CHUNK:
+                self.flush(column)
+
+    def flush(self, column):
+        buffer = column['buffer']
+        if sys.byteorder == 'big' and column['ordinal']:
+            buffer.byteswap()
+        buffer.tofile(column['file'])
+        del buffer[:]
+
+    def close(self, rows, texts):
+        manifest = {'length': rows, 'columns': []}
+        for n, column in enumerate(self.columns):
+            self.flush(column)
+            column['file'].close()
+            entry = {'name': column['name'], 'file': f'{n}.bin'}
+            if column['ordinal']:
+                entry.update(type='ordinal', dtype='int32', domain=list(column['domain']))
+                axis = bucket_axis(entry['domain'], column['counts'], self.view.max_categories)
+                if axis:
+                    entry['axis'] = axis
+            else:
+                entry.update(type='numeric', dtype='int32' if column['integral'] else 'float32')
+                if column['name'] in texts:
+                    entry['text'] = texts[column['name']]
+                self.narrow(column, self.dataDir / entry['file'], entry['dtype'])
+            if self.view.index:
+                self.write_index(column, entry, n)
+            manifest['columns'].append(entry)
+        self.tmp.cleanup()
+        (self.dataDir / 'manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+        self.out.write("var dataManifest = 'files/data/manifest.json';\n")
+
+    def write_index(self, column, entry, n):
+        values = array.array('i' if column['ordinal'] else 'd')
+        source = self.dataDir / entry['file'] if column['ordinal'] else column['file'].name
+        with open(source, 'rb') as part:
+            values.frombytes(part.read())
+        if sys.byteorder == 'big' and column['ordinal']:
+            values.byteswap()
+        order, offsets = build_index(values, column['ordinal'], len(column['domain']))
+        if sys.byteorder == 'big':
+            order.byteswap()
+        entry['order'] = f'{n}.order.bin'
+        with open(self.dataDir / entry['order'], 'wb') as part:
+            order.tofile(part)
+        if offsets is not None:
+            entry['offsets'] = offsets
+
+    def narrow(self, column, target, dtype):
+        """Convert the staged float64 file into its final Int32/Float32 form."""
+        with open(column['file'].name, 'rb') as src, open(target, 'wb') as dst:
+            while True:
+                staged = array.array('d')
+                try:
+                    staged.fromfile(src, self.CHUNK)
+                except EOFError:
+                    pass
+                if not staged:
+                    break
+                final = array.array('i' if dtype == 'int32' else 'f',
+                                    (int(v) for v in staged) if dtype == 'int32' else staged)
+                if sys.byteorder == 'big':
+                    final.byteswap()
+                final.tofile(dst)
+
 
-if len(argv) > 1 and len(argv) <= 2:
-    print(f"Usage: {argv[0]} <csv file> <group Column name> [columns to omit, ...]")
-    print(f"Example: {argv[0]} Public.csv 'Institution' 'name'")
-    exit(1)
-elif len(argv) > 2:
-    csvName     = argv[1]
-    groupColumn = argv[2]
-    excludes    = argv[3:]
+WRITERS = {'rows': RowWriter, 'columnar': ColumnarWriter, 'sharded': ShardedWriter, 'binary': BinaryWriter}
 
-print(f"Using {csvName!r} file and '{groupColumn}' as Group")
-if excludes:
-    print(f"Excluding columns: {', '.join(excludes)}")
-print()
 
-# ── Use pathlib for robust path handling ─────────────────────────────────────────
-# CSV is alongside this script
-csvPath = SCRIPT_DIR / csvName
-if not csvPath.exists():
-    raise FileNotFoundError(f"CSV not found at {csvPath!r}")
+class StatsCollector:
+    """Aggregates for files/stats.js, gathered during the streaming pass.
 
-path    = csvPath.stem
-baseDir = SCRIPT_DIR.parent / path      # create output next to builder folder
-baseDir.mkdir(exist_ok=True)
+    Per-column min/max and missing counts, a count per category of each
+    ordinal column (by dictionary code, i.e. in the same first-seen order
+    as the dictionaries in data.js, which are not repeated; up to
+    STATS_CATEGORIES categories, except for the columns the page can
+    colour by, which are always counted), per-group row counts when the group
+    column is numeric, and equal-width histograms for numeric columns. Numbers
+    are staged as float64 in temporary files until min/max are known, so
+    memory does not grow with the number of rows.
 
-# Copy the template directory into the output folder
-dir_util.copy_tree(str(TEMPLATE_DIR), str(baseDir))
-print(f"Copied files to folder {baseDir}")
+    With --sample N every row gets a random key. The 2N rows with the
+    smallest keys form a uniform pool, and while there are no more groups
+    than N, each group's smallest-key row is kept too. close() draws
+    exactly N rows from them (see sample), so memory stays O(N) however
+    many rows or groups there are.
+    """
 
-groups   = []
-firstRow = {}
+    def __init__(self, view, fieldnames, ordinals):
+        self.view    = view
+        self.tmp     = tempfile.TemporaryDirectory()
+        self.ordinalGroup = view.group in ordinals
+        self.groups  = {}
+        self.rows    = 0
+        self.random  = random.Random(0)
+        self.pool    = []   # max-heap of (-key, row, group)
+        self.firsts  = {}   # group -> (key, row) of its smallest key; None past N groups
+        self.columns = []
+        grouping = {view.group, *view.group_by}
+        for n, name in enumerate(fieldnames):
+            ordinal = name in ordinals
+            self.columns.append({
+                'name':    name,
+                'ordinal': ordinal,
+                'counts':  {},
+                'capped':  name not in grouping,
+                'min':     math.inf,
+                'max':     -math.inf,
+                'missing': 0,
+                'buffer':  array.array('d'),
+                'file':    None if ordinal else open(Path(self.tmp.name) / f'{n}.bin', 'w+b'),
+            })
 
-# Read CSV and write JSON
-with open(csvPath, newline='', encoding='utf-8') as csvfile, \
-     open(baseDir / 'files' / 'data.js', 'w', encoding='utf-8') as jsonfile:
-    reader = csv.DictReader(csvfile)
-    jsonfile.write('var dataJSON = [')
-    for row in reader:
-        if not firstRow:
-            firstRow = row.copy()
-        if row[groupColumn] not in groups:
-            groups.append(row[groupColumn])
-        json.dump(row, jsonfile)
-        jsonfile.write(',\n')
-    jsonfile.write(']')
+    def add(self, row, group):
+        self.groups[group] = self.groups.get(group, 0) + 1
+        if self.view.sample > 0:
+            self.offer(group)
+        self.rows += 1
+        for column in self.columns:
+            value = row[column['name']]
+            if column['ordinal']:
+                counts = column['counts']
+                if counts is not None:
+                    counts[value] = counts.get(value, 0) + 1
+                    if len(counts) > STATS_CATEGORIES and column['capped']:
+                        column['counts'] = None
+                continue
+            try:
+                number = float(value)
+            except ValueError:
+                number = math.nan
+            if not math.isfinite(number):
+                column['missing'] += 1
+                continue
+            if number < column['min']:
+                column['min'] = number
+            if number > column['max']:
+                column['max'] = number
+            column['buffer'].append(number)
+            if len(column['buffer']) >= BinaryWriter.CHUNK:
+                column['buffer'].tofile(column['file'])
+                del column['buffer'][:]
 
-print(f"Wrote new json file {baseDir / 'files' / 'data.js'}\n")
+    def close(self, rows):
+        stats = {'rows': rows, 'group': self.view.group, 'columns': {}}
+        if not self.ordinalGroup:
+            stats['groups'] = self.groups
+        for column in self.columns:
+            if column['ordinal']:
+                entry = {'type': 'ordinal'}
+                if column['counts'] is not None:
+                    entry['counts'] = list(column['counts'].values())
+            else:
+                entry = {'type': 'numeric', 'missing': column['missing']}
+                if column['min'] <= column['max']:
+                    entry.update(min=column['min'], max=column['max'], bins=self.histogram(column))
+            stats['columns'][column['name']] = entry
+        if self.view.sample > 0:
+            stats['sample'] = self.sample(rows)
+        self.tmp.cleanup()
+        return stats
 
+    def discard(self):
+        for column in self.columns:
+            if column['file']:
+                column['file'].close()
+        self.tmp.cleanup()
 
+    def numbers(self, name):
+        """Cells of numeric column `name` that held a number."""
+        column = next(c for c in self.columns if c['name'] == name)
+        return self.rows - column['missing']
 
+    def offer(self, group):
+        """Give the current row a random key and keep it if it is among the
+        smallest keys of the pool or of its group."""
+        key, row = self.random.random(), self.rows
+        if len(self.pool) < 2 * self.view.sample:
+            heapq.heappush(self.pool, (-key, row, group))
+        elif key < -self.pool[0][0]:
+            heapq.heapreplace(self.pool, (-key, row, group))
+        if self.firsts is not None:
+            first = self.firsts.get(group)
+            if first is None or key < first[0]:
+                self.firsts[group] = (key, row)
+            if len(self.firsts) > self.view.sample:
+                self.firsts = None   # more groups than sampled rows: no floor per group
 
-# Replace function using Python instead of sed
-def replace(s1, s2, filename):
-    filename = Path(filename)
-    content  = filename.read_text(encoding='utf-8')
-    filename.write_text(content.replace(s1, s2), encoding='utf-8')
+    def sample(self, rows):
+        """Sorted row ids of a stratified sample of exactly min(--sample, rows).
 
+        While there are no more groups than N, every group gets one row
+        and the rest of the sample is shared out by largest remainder in
+        proportion to the group sizes. Each group's quota is taken from its
+        smallest keys, a uniform draw within the group; a group with too
+        few rows in the pool leaves its shortfall to the pool's smallest
+        keys. With more groups than N the sample is the pool's N smallest
+        keys, a uniform draw over every row.
+        """
+        size  = min(self.view.sample, rows)
+        drawn = sorted((-key, row, group) for key, row, group in self.pool)
+        picked = set()
+        if self.firsts is not None:
+            byGroup = {}
+            for key, row, group in drawn:
+                byGroup.setdefault(group, []).append(row)
+            spare  = size - len(self.groups)
+            shares = {group: spare * count / rows for group, count in self.groups.items()}
+            quotas = {group: 1 + int(share) for group, share in shares.items()}
+            left   = size - sum(quotas.values())
+            for group in sorted(shares, key=lambda g: shares[g] - int(shares[g]), reverse=True)[:left]:
+                quotas[group] += 1
+            for group, quota in quotas.items():
+                first, candidates = self.firsts[group][1], byGroup.get(group, [])
+                if first not in candidates[:1]:
+                    candidates.insert(0, first)
+                picked.update(candidates[:quota])
+        for key, row, group in drawn:
+            if len(picked) >= size:
+                break
+            picked.add(row)
+        return sorted(picked)
+
+    def histogram(self, column):
+        lo, hi = column['min'], column['max']
+        bins   = [0] * HISTOGRAM_BINS
+        scale  = HISTOGRAM_BINS / (hi - lo) if hi > lo else 0
+        source = column['file']
+        column['buffer'].tofile(source)
+        source.seek(0)
+        while True:
+            staged = array.array('d')
+            try:
+                staged.fromfile(source, BinaryWriter.CHUNK)
+            except EOFError:
+                pass
+            if not staged:
+                break
+            for v in staged:
+                bins[min(int((v - lo) * scale), HISTOGRAM_BINS - 1)] += 1
+        source.close()
+        return bins
+
+
+def sparse(cells):
+    """Non-empty cells as flat [cell, count, cell, count, ...] pairs."""
+    return [v for c, n in enumerate(cells) if n for v in (c, n)]
+
+
+class DensityCollector:
+    """Pairwise 2-D histograms for the density renderer, added to stats.js.
+
+    Every axis the page shows by default (the columns minus `id` and the
+    excludes) is binned: numeric axes into DENSITY_BINS equal-width bins
+    over their min/max, ordinal axes by axis category. For each pair of
+    neighbouring axes the rows are counted per (bin, bin) cell and per
+    group, or all together once there are more than DENSITY_GROUPS groups.
+    Pairs with an ordinal axis of more than DENSITY_CATEGORIES categories
+    are left out, so no tile grows with the number of distinct values.
+    Tiles are written sparsely, as flat [cell, count, ...] pairs of the
+    non-empty cells. Bins depend on the final min/max, so the rows are
+    staged in temporary files, one float64 per axis per row, and binned in
+    chunks by close() with NumPy when it is installed.
+    """
+
+    def __init__(self, view, fieldnames, ordinals):
+        self.view   = view
+        self.tmp    = tempfile.TemporaryDirectory()
+        self.groups = {}     # None past DENSITY_GROUPS groups
+        self.codes  = array.array('i')
+        self.codeFile = open(Path(self.tmp.name) / 'groups.bin', 'w+b')
+        self.axes   = []
+        for n, name in enumerate(fieldnames):
+            if name == 'id' or name in view.excludes:
+                continue
+            self.axes.append({
+                'name':    name,
+                'ordinal': name in ordinals,
+                'domain':  {},
+                'counts':  [],
+                'min':     math.inf,
+                'max':     -math.inf,
+                'buffer':  array.array('d'),
+                'file':    open(Path(self.tmp.name) / f'{n}.bin', 'w+b'),
+            })
+
+    def add(self, row, group):
+        code = 0
+        if self.groups is not None:
+            code = self.groups.setdefault(group, len(self.groups))
+            if len(self.groups) > DENSITY_GROUPS:
+                self.groups = None   # the codes staged so far are ignored
+        self.codes.append(code)
+        for axis in self.axes:
+            value = row[axis['name']]
+            if axis['ordinal']:
+                number = encode(axis, value)
+            else:
+                try:
+                    number = float(value)
+                except ValueError:
+                    number = math.nan
+                if math.isfinite(number):
+                    axis['min'] = min(axis['min'], number)
+                    axis['max'] = max(axis['max'], number)
+                else:
+                    number = math.nan
+            axis['buffer'].append(number)
+        if len(self.codes) >= BinaryWriter.CHUNK:
+            self.spill()
+
+    def spill(self):
+        self.codes.tofile(self.codeFile)
+        del self.codes[:]
+        for axis in self.axes:
+            axis['buffer'].tofile(axis['file'])
+            del axis['buffer'][:]
+
+    def close(self, rows):
+        self.spill()
+        limit = 0 if self.view.format == 'rows' else self.view.max_categories
+        for axis in self.axes:
+            if axis['ordinal']:
+                bucketed = bucket_axis(list(axis['domain']), axis['counts'], limit)
+                axis['map']  = bucketed['codes'] if bucketed else list(range(len(axis['domain'])))
+                axis['size'] = len(bucketed['domain']) if bucketed else len(axis['domain'])
+            else:
+                axis['size']  = DENSITY_BINS
+                axis['scale'] = DENSITY_BINS / (axis['max'] - axis['min']) if axis['max'] > axis['min'] else 0
+            axis['file'].seek(0)
+        self.codeFile.seek(0)
+
+        split  = self.groups is not None
+        groups = list(self.groups) if split else ['']
+        pairs  = [(a, b) for a, b in zip(self.axes, self.axes[1:])
+                  if a['size'] <= DENSITY_CATEGORIES and b['size'] <= DENSITY_CATEGORIES]
+        used   = [axis for axis in self.axes if any(axis is a or axis is b for a, b in pairs)]
+        counts = [[0] * (len(groups) * a['size'] * b['size']) for a, b in pairs]
+        tally  = self.tally_numpy if np is not None else self.tally
+        for start in range(0, rows, BinaryWriter.CHUNK):
+            n = min(BinaryWriter.CHUNK, rows - start)
+            codes = array.array('i')
+            if split:
+                codes.fromfile(self.codeFile, n)
+            else:
+                codes.frombytes(bytes(4 * n))
+            bins = {axis['name']: self.bins(axis, n) for axis in used}
+            for k, (a, b) in enumerate(pairs):
+                tally(counts[k], codes, bins[a['name']], bins[b['name']], a['size'] * b['size'], b['size'])
+
+        density = {'bins': DENSITY_BINS, 'groups': DENSITY_GROUPS, 'categories': DENSITY_CATEGORIES,
+                   'pairs': []}
+        for k, (a, b) in enumerate(pairs):
+            cells = a['size'] * b['size']
+            tile  = {
+                'axes':   [a['name'], b['name']],
+                'sizes':  [a['size'], b['size']],
+                'counts': {group: sparse(counts[k][g * cells:(g + 1) * cells])
+                           for g, group in enumerate(groups)},
+            }
+            if not split:
+                tile['total'] = True
+            density['pairs'].append(tile)
+        self.discard()
+        return density
+
+    def discard(self):
+        self.codeFile.close()
+        for axis in self.axes:
+            axis['file'].close()
+        self.tmp.cleanup()
+
+    def bins(self, axis, n):
+        """Bin of each of the next n staged rows of an axis; -1 when missing."""
+        staged = array.array('d')
+        staged.fromfile(axis['file'], n)
+        if np is not None:
+            values = np.frombuffer(staged, dtype=np.float64)
+            if axis['ordinal']:
+                return np.asarray(axis['map'], dtype=np.int64)[values.astype(np.int64)]
+            bins = np.full(len(values), -1, dtype=np.int64)
+            finite = ~np.isnan(values)
+            bins[finite] = np.minimum(((values[finite] - axis['min']) * axis['scale']).astype(np.int64),
+                                      DENSITY_BINS - 1)
+            return bins
+        if axis['ordinal']:
+            return [axis['map'][int(v)] for v in staged]
+        lo, scale, top = axis['min'], axis['scale'], DENSITY_BINS - 1
+        return [-1 if v != v else min(int((v - lo) * scale), top) for v in staged]
+
+    @staticmethod
+    def tally(counts, codes, a, b, cells, width):
+        for g, i, j in zip(codes, a, b):
+            if i >= 0 and j >= 0:
+                counts[g * cells + i * width + j] += 1
+
+    @staticmethod
+    def tally_numpy(counts, codes, a, b, cells, width):
+        valid = (a >= 0) & (b >= 0)
+        cell  = np.frombuffer(codes, dtype=np.int32)[valid] * cells + a[valid] * width + b[valid]
+        for k, n in enumerate(np.bincount(cell, minlength=len(counts)).tolist()):
+            counts[k] += n
+
+
+class ClusterCollector:
+    """Map clusters for stats.js: the rows in each grid cell per zoom level.
+
+    Cells are CLUSTER_CELL pixels square in Web Mercator world pixels (the
+    projection Leaflet draws in), numbered row-major. Rows are counted in
+    the cells of CLUSTER_ZOOM only; every lower zoom merges four cells
+    into one, so each row is projected once. A cell is written as
+    [key, rows, mean latitude, mean longitude, sum of row ids]; the sum is
+    the row id itself once only one row is left in the cell, which lets
+    the page patch cells as rows are filtered in and out.
+    """
+
+    def __init__(self, fieldnames):
+        self.lat   = next((name for name in LAT_FIELDS if name in fieldnames), None)
+        self.lon   = next((name for name in LON_FIELDS if name in fieldnames), None)
+        self.rows  = 0
+        self.cells = {}
+
+    def add(self, row):
+        i = self.rows
+        self.rows += 1
+        if not self.lat or not self.lon:
+            return
+        try:
+            lat, lon = float(row[self.lat]), float(row[self.lon])
+        except ValueError:
+            return
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return
+        x, y  = world_pixel(lat, lon)
+        scale = 2 ** CLUSTER_ZOOM / CLUSTER_CELL
+        top   = 2 ** (CLUSTER_ZOOM + 8) // CLUSTER_CELL - 1
+        key   = (min(int(y * scale), top), min(int(x * scale), top))
+        cell  = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = [1, lat, lon, i]
+        else:
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+            cell[3] += i
+
+    def close(self):
+        if not self.lat or not self.lon:
+            return None
+        levels = []
+        cells  = self.cells
+        for zoom in range(CLUSTER_ZOOM, -1, -1):
+            width = 2 ** (zoom + 8) // CLUSTER_CELL
+            levels.append([[cy * width + cx, n, round(lat / n, 5), round(lon / n, 5), i]
+                           for (cy, cx), (n, lat, lon, i) in sorted(cells.items())])
+            merged = {}
+            for (cy, cx), (n, lat, lon, i) in cells.items():
+                cell = merged.get((cy >> 1, cx >> 1))
+                if cell is None:
+                    merged[cy >> 1, cx >> 1] = [n, lat, lon, i]
+                else:
+                    cell[0] += n
+                    cell[1] += lat
+                    cell[2] += lon
+                    cell[3] += i
+            cells = merged
+        return {'lat': self.lat, 'lon': self.lon, 'cell': CLUSTER_CELL, 'levels': levels[::-1]}
+
+
+def world_pixel(lat, lon):
+    """Web Mercator position of a point, in 256-pixel tiles at zoom 0."""
+    lat = max(-85.0511287798, min(85.0511287798, lat))
+    s   = math.sin(math.radians(lat))
+    return (lon + 180) / 360 * 256, (0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * 256
+
+
+# ── One output folder ────────────────────────────────────────────────────────
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def print_report(rows, seconds):
+    """Print the wall-clock / peak-RSS summary for a build."""
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"Build report: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak RSS: {rss:.1f} MB")
 
-# right after you detect firstRow, before your replace() calls:
 
 axis_order = [
     "State",
@@ -85,34 +1103,534 @@ axis_order = [
 
 ]
 
-# filter out any excludes, just in case
-axis_order = [c for c in axis_order if c in firstRow and c not in excludes]
 
-# now inject that order into your JS
-replace('DIMENSIONS', json.dumps(axis_order), baseDir / 'files' / 'parallel-coordinates.js')
+class Template:
+    """A page parsed once into literal chunks and placeholder slots.
 
+    All placeholders are found in a single scan, longest first and only
+    as whole tokens, so GROUP never matches the start of GROUPS and text
+    that was substituted in is never scanned again. Rendering joins the
+    chunks with the values and writes the page once. Parsed templates are
+    cached per process, so batch builds parse each page only once.
+    """
 
-# Detect column types
-print("Detected column types:")
-ordinals = []
-for key, value in firstRow.items():
-    try:
-        float(value)
-        print(f"Numeric {key} {value}")
-    except ValueError:
-        print(f"Ordinal {key} {value}")
-        ordinals.append(key)
-
-# Generate colors
-colors = {i: f'#{random.randint(0, 0xFFFFFF):06x}' for i in groups}
-
-# Replace placeholders in files
-replace('COLORS',   json.dumps(colors) + ';',                 baseDir / 'index.html')
-replace('TITLE',    path,                                     baseDir / 'index.html')
-replace('GROUPS',   json.dumps(groups) + ';',                 baseDir / 'index.html')
-replace('GROUP',    groupColumn,                              baseDir / 'index.html')
-replace('ORDINALS', json.dumps(ordinals),                     baseDir / 'files' / 'parallel-coordinates.js')
-replace('EXCLUDES', json.dumps(excludes),                     baseDir / 'files' / 'parallel-coordinates.js')
-replace('GROUP',    groupColumn,                              baseDir / 'files' / 'parallel-coordinates.js')
-
-print(f"Saved to: {baseDir}")
+    _parsed = {}
+
+    def __init__(self, text, keys):
+        self.chunks = []
+        self.slots  = []
+        start = 0
+        if keys:
+            alternatives = '|'.join(re.escape(k) for k in sorted(keys, key=len, reverse=True))
+            for match in re.finditer(rf'(?<!\w)(?:{alternatives})(?!\w)', text):
+                self.chunks.append(text[start:match.start()])
+                self.slots.append(match.group())
+                start = match.end()
+        self.chunks.append(text[start:])
+
+    @classmethod
+    def load(cls, path, digest, keys):
+        """Parsed template for `path`, whose content hash is `digest`."""
+        cacheKey = (str(path), digest, tuple(sorted(keys)))
+        if cacheKey not in cls._parsed:
+            cls._parsed[cacheKey] = cls(Path(path).read_text(encoding='utf-8'), keys)
+        return cls._parsed[cacheKey]
+
+    def render(self, values):
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(values[slot])
+            parts.append(chunk)
+        return ''.join(parts)
+
+
+# Template files with placeholders, rendered rather than copied
+PAGES = ['index.html', 'files/parallel-coordinates.js', 'files/worker.js']
+
+# Third-party libraries in the template. They are kept once, under
+# content-hashed names, in VENDOR_DIR (next to the output folders) and the
+# pages load them by those names, so every dashboard shares the same files
+# and the same browser cache entries.
+VENDOR = [
+    'files/backbone.js', 'files/d3.js', 'files/d3_002.js', 'files/d3_003.js',
+    'files/jquery-ui-1.js', 'files/jquery.js', 'files/jquery_002.js',
+    'files/slick.css', 'files/slick.js', 'files/slick_002.js', 'files/slick_003.js',
+    'files/slick_004.js', 'files/underscore.js',
+]
+VENDOR_DIR = SCRIPT_DIR.parent / 'vendor'
+
+# Build cache kept in every output folder
+CACHE_FILE = '.build.json'
+CACHE_VERSION = 9
+
+
+class Build:
+    """One view of a CSV: a template copy plus its data.js and stats.js.
+
+    Rows are fed in one at a time by `build_views`, so several views of
+    the same CSV can share a single read of the file. Groups live in a
+    dict (insertion ordered, O(1) membership) so memory only grows with
+    the number of distinct groups, never with the number of rows.
+
+    The output folder keeps a cache manifest (CACHE_FILE) with hashes of
+    the CSV, of every template file and of the options used. A rebuild
+    only copies template files that changed, only rewrites data.js and
+    stats.js when the CSV or a data option changed (then `fresh` is
+    False and the view needs rows), and only re-renders the pages when
+    one of their inputs changed.
+    """
+
+    def __init__(self, view, schema):
+        self.view    = view
+        self.csvPath = SCRIPT_DIR / view.csv
+        self.name    = view.name or self.csvPath.stem
+        self.layout  = view.format
+        if view.format == 'columnar' and view.binary:
+            self.layout = 'binary'
+        elif view.format == 'columnar' and view.shard_rows > 0:
+            self.layout = 'sharded'
+        self.groups  = {}
+        self.rows    = 0
+        self.writer  = None
+
+        print(f"Using {view.csv!r} file and '{view.group}' as Group")
+        if view.excludes:
+            print(f"Excluding columns: {', '.join(view.excludes)}")
+        if view.drop:
+            print(f"Dropping columns: {', '.join(view.drop)}")
+        for group in [view.group] + view.group_by:
+            if group in view.drop:
+                raise ValueError(f"Cannot drop the group column {group!r}")
+        if not 0 <= view.max_text_share <= 1:
+            raise ValueError(f"--max-text-share expects a share from 0 to 1, got {view.max_text_share}")
+        print()
+
+        # create output next to builder folder
+        view.outDir = SCRIPT_DIR.parent / self.name
+        view.outDir.mkdir(exist_ok=True)
+
+        self.cache = {} if view.force else self.load_cache()
+        self.template = self.sync_template()
+
+        self.source = schema['source']
+        self.dataKey = {'csv': self.source['sha256'], 'types': schema['types'], 'group': view.group,
+                        'layout': self.layout, 'index': view.index,
+                        'max_categories': view.max_categories, 'shard_rows': view.shard_rows,
+                        'sample': view.sample, 'density': view.renderer == 'density',
+                        # the density tiles leave out the excluded axes
+                        'excludes': sorted(view.excludes) if view.renderer == 'density' else [],
+                        'precision': view.precision, 'quantize': sorted(view.quantize),
+                        'drop': sorted(view.drop), 'group_by': view.group_by,
+                        'max_text_share': view.max_text_share}
+        self.fresh = (self.cache.get('data') == self.dataKey and
+                      all((view.outDir / 'files' / f).exists() for f in ('data.js', 'stats.js')))
+        if self.fresh:
+            print(f"{self.name}: data.js is up to date")
+        else:
+            self.jsonfile = open(view.outDir / 'files' / 'data.js', 'w', encoding='utf-8')
+
+    def load_cache(self):
+        try:
+            cache = json.loads((self.view.outDir / CACHE_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+        return cache if cache.get('version') == CACHE_VERSION else {}
+
+    def sync_template(self):
+        """Copy the template files that are new or changed since the last build."""
+        before, hashes, copied = self.cache.get('template', {}), {}, 0
+        for source in sorted(TEMPLATE_DIR.rglob('*')):
+            if not source.is_file():
+                continue
+            rel    = source.relative_to(TEMPLATE_DIR).as_posix()
+            target = self.view.outDir / rel
+            hashes[rel] = file_digest(source)
+            if rel in PAGES or rel in VENDOR or (hashes[rel] == before.get(rel) and target.exists()):
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+        print(f"Copied {copied} of {len(hashes) - len(VENDOR)} template files to folder {self.view.outDir}")
+        return hashes
+
+    def link_vendor(self):
+        """Put each vendor library in VENDOR_DIR under its hashed name and,
+        with --vendor link, hardlink it into this output (copying where links
+        are not possible). Returns {template path: URL relative to files/}."""
+        urls = {}
+        VENDOR_DIR.mkdir(exist_ok=True)
+        for rel in VENDOR:
+            source = TEMPLATE_DIR / rel
+            hashed = f'{source.stem}.{self.template[rel][:10]}{source.suffix}'
+            shared = VENDOR_DIR / hashed
+            if not shared.exists():
+                write_atomic(shared, lambda partial: shutil.copy2(source, partial))
+            if self.view.vendor == 'shared':
+                urls[rel] = f'../../{VENDOR_DIR.name}/{hashed}'
+                continue
+            target = self.view.outDir / 'files' / hashed
+            if not target.exists():
+                try:
+                    os.link(shared, target)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    shutil.copy2(shared, target)
+            urls[rel] = hashed
+        return urls
+
+    def begin(self, header, ordinals):
+        # the CSV columns this view keeps, and where they sit in each record
+        fieldnames   = [name for name in header if name not in self.view.drop]
+        self.picks   = [(name, header.index(name)) for name in fieldnames]
+        self.columns = fieldnames
+        for name in sorted(set(self.view.drop) - set(header)):
+            print(f"Warning: --drop column {name!r} is not in the CSV")
+        self.writer  = WRITERS[self.layout](self.view, self.jsonfile, fieldnames, ordinals)
+        self.stats   = StatsCollector(self.view, fieldnames, ordinals)
+        self.density = DensityCollector(self.view, fieldnames, ordinals) if self.view.renderer == 'density' else None
+        self.clusters = ClusterCollector(fieldnames)
+        # rows per value of each extra --group-by column (the main group is
+        # counted by StatsCollector)
+        self.groupings = []
+        for name in self.view.group_by:
+            if name not in fieldnames:
+                print(f"Warning: --group-by column {name!r} is not in the CSV")
+            elif name != self.view.group and name not in (g[0] for g in self.groupings):
+                self.groupings.append((name, name in ordinals, {}))
+        steps = parse_quantize(self.view.quantize)
+        for name in set(steps) - set(fieldnames):
+            print(f"Warning: --quantize column {name!r} is not in the CSV")
+        self.numeric = []
+        self.texts   = {}   # numeric column -> {row id: text cell}
+        for name in fieldnames:
+            if name in ordinals:
+                continue
+            step   = steps.get(name)
+            digits = self.view.precision
+            if digits is None and step:
+                digits = decimals(step)
+            self.numeric.append((name, step, digits))
+
+    def coerce(self, record):
+        """A CSV record as a row of the kept columns, with every numeric cell
+        parsed once into a float (NaN when blank or unparseable), quantised
+        and rounded, so data.js, stats.js and the map clusters all see the
+        same values. Text the type inference never saw is kept by row id in
+        `texts` for the grid and export (see build_views)."""
+        width = len(record)
+        row   = {name: record[i] if i < width else None for name, i in self.picks}
+        for name, step, digits in self.numeric:
+            value = row[name]
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = math.nan
+                if value and value.strip().lower() not in MISSING:
+                    self.texts.setdefault(name, {})[self.rows] = value
+            if not math.isfinite(number):
+                number = math.nan
+            else:
+                if step:
+                    number = round(number / step) * step
+                if digits is not None:
+                    number = round(number, digits)
+            row[name] = number
+        return row
+
+    def add(self, record):
+        row = self.coerce(record)
+        group = self.writer.group_key(row)
+        self.groups.setdefault(group, None)
+        for name, ordinal, counts in self.groupings:
+            value = group_value(row[name], ordinal)
+            counts[value] = counts.get(value, 0) + 1
+        self.stats.add(row, group)
+        if self.density:
+            self.density.add(row, group)
+        self.clusters.add(row)
+        self.writer.write(row)
+        self.rows += 1
+
+    def text_share(self, name):
+        """Share of the non-blank cells of numeric column `name` that are text."""
+        texts = len(self.texts[name])
+        return texts / (self.stats.numbers(name) + texts)
+
+    def abort(self):
+        """Drop this pass, closing and deleting what it staged, before the
+        CSV is read again."""
+        self.writer.discard()
+        self.stats.discard()
+        if self.density:
+            self.density.discard()
+        self.jsonfile.close()
+
+    def finish(self):
+        view, outDir = self.view, self.view.outDir
+        result = self.cache.get('result', {})
+        if self.fresh:
+            self.rows, groupings, self.columns = result['rows'], result['groupings'], result['columns']
+        else:
+            self.writer.close(self.rows, self.texts)
+            self.jsonfile.close()
+
+            # Aggregates for the first paint (pie, totals, axis extents, histograms)
+            stats = self.stats.close(self.rows)
+            # text groupings are counted per category in stats['columns']
+            numeric = {name: counts for name, ordinal, counts in self.groupings if not ordinal}
+            if numeric:
+                stats['groupings'] = numeric
+            if self.density:
+                stats['density'] = self.density.close(self.rows)
+            clusters = self.clusters.close()
+            if clusters:
+                stats['clusters'] = clusters
+            (outDir / 'files' / 'stats.js').write_text(f'var dataStats = {json.dumps(stats)};\n', encoding='utf-8')
+
+            # groups of every column the page can colour by, main group first
+            groupings = {view.group: list(self.groups)}
+            groupings.update((name, list(counts)) for name, _, counts in self.groupings)
+            print(f"Wrote new {self.layout} json file {outDir / 'files' / 'data.js'} "
+                  f"({self.rows} rows, {len(self.groups)} groups)\n")
+
+        renderer = view.renderer
+        if renderer == 'auto':
+            renderer = 'canvas' if self.rows > CANVAS_ROWS else 'svg'
+        print(f"Renderer: {renderer}")
+
+        # Generate colors per grouping; groups seen by an earlier build keep theirs
+        before = result.get('colors', {})
+        colors = {name: {i: before.get(name, {}).get(i) or f'#{random.randint(0, 0xFFFFFF):06x}'
+                         for i in groups}
+                  for name, groups in groupings.items()}
+
+        # filter out any excludes, just in case
+        order = [c for c in axis_order if c in self.columns and c not in view.excludes]
+
+        # Placeholders in each page
+        pages = {
+            'index.html': {
+                'GROUPINGS':  json.dumps({name: {'groups': groups, 'colors': colors[name]}
+                                          for name, groups in groupings.items()}) + ';',
+                'TITLE':      self.name,
+                'GROUP':      view.group,
+            },
+            'files/parallel-coordinates.js': {
+                'DIMENSIONS': json.dumps(order),
+                'EXCLUDES':   json.dumps(view.excludes),
+                'RENDERER':   renderer,
+            },
+            'files/worker.js': {},
+        }
+        # Vendor libraries by their hashed names
+        for rel, url in self.link_vendor().items():
+            name = rel.split('/')[-1]
+            pages['index.html'][f'"{rel}"'] = f'"files/{url}"'
+            pages['files/worker.js'][f"'{name}'"] = f"'{url}'"
+
+        rendered = self.cache.get('pages', {})
+        for rel, values in pages.items():
+            key = {'template': self.template.get(rel), 'replacements': values}
+            if rendered.get(rel) == key and (outDir / rel).exists():
+                continue
+            page = Template.load(TEMPLATE_DIR / rel, self.template[rel], values)
+            (outDir / rel).write_text(page.render(values), encoding='utf-8')
+            rendered[rel] = key
+            print(f"Rendered {rel}")
+
+        cache = {
+            'version':  CACHE_VERSION,
+            'source':   self.source,
+            'template': self.template,
+            'data':     self.dataKey,
+            'result':   {'rows': self.rows, 'groupings': groupings, 'colors': colors,
+                         'columns': self.columns},
+            'pages':    rendered,
+        }
+        (outDir / CACHE_FILE).write_text(json.dumps(cache), encoding='utf-8')
+
+        print(f"Saved to: {outDir}")
+
+
+# ── Streaming pass: one read of the CSV, rows written as they arrive ─────────
+def build_views(views):
+    """Build every view of one CSV from a single read of the file.
+
+    The CSV is not read at all when every view's data is up to date.
+    Returns one {name, csv, group, rows, seconds, rss} summary per view,
+    where rss is the peak RSS of this process so far in MB (or None).
+    """
+    start   = time.perf_counter()
+    csvPath = SCRIPT_DIR / views[0].csv
+    if not csvPath.exists():
+        raise FileNotFoundError(f"CSV not found at {csvPath!r}")
+    schema   = load_schema(csvPath, views[0].infer_rows)
+    ordinals = [name for name, kind in schema['types'].items()
+                if kind in ('categorical', 'high-cardinality')]
+
+    builds = [Build(view, schema) for view in views]
+    stale  = [build for build in builds if not build.fresh]
+    if stale:
+        print_schema(schema)
+        with open(csvPath, newline='', encoding='utf-8') as csvfile:
+            # plain records: each view builds dicts of only the columns it keeps
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            for build in stale:
+                build.begin(header, ordinals)
+            for record in reader:
+                if not record:
+                    continue
+                for build in stale:
+                    build.add(record)
+
+        # Text in a numeric column past the rows types were inferred from:
+        # a small share stays off the axis and is kept as text, more makes
+        # the column categorical, which takes another read
+        texts, promoted = {}, set()
+        for build in stale:
+            for name, cells in build.texts.items():
+                share = build.text_share(name)
+                if share > build.view.max_text_share:
+                    promoted.add(name)
+                texts.setdefault(name, (cells, share))
+        for name, (cells, share) in texts.items():
+            row, value = next(iter(cells.items()))
+            print(f"Warning: column {name!r} was inferred as {schema['types'][name]} but has "
+                  f"{len(cells)} non-numeric cell(s) ({share:.2%} of its values), the first "
+                  f"{value!r} in data row {row + 1}; " +
+                  ("rebuilding it as categorical" if name in promoted else
+                   "they are left off the axis and kept as text for the grid and export"))
+        if promoted:
+            for name in promoted:
+                schema['types'][name] = 'categorical'
+            save_schema(csvPath, schema)
+            for build in stale:
+                build.abort()
+            return build_views(views)
+
+    summaries = []
+    for build in builds:
+        build.finish()
+        summaries.append({'name': build.name, 'csv': build.view.csv, 'group': build.view.group,
+                          'rows': build.rows, 'seconds': time.perf_counter() - start,
+                          'rss': peak_rss_mb()})
+    return summaries
+
+
+def layout_conflict(view):
+    """Why the data.js layout options of `view` cannot be used together, or None."""
+    if view.format == 'rows':
+        for flag, given in (('--binary', view.binary), ('--index', view.index),
+                            ('--shard-rows', view.shard_rows > 0)):
+            if given:
+                return f"{flag} needs --format columnar"
+    if view.shard_rows > 0 and view.binary:
+        return "--shard-rows cannot be combined with --binary"
+    if view.shard_rows > 0 and view.index:
+        return "--index cannot be combined with --shard-rows"
+    return None
+
+
+def with_defaults(view):
+    """`view` with the positional defaults filled in."""
+    view.csv   = view.csv or DEFAULT_CSV
+    view.group = view.group or DEFAULT_GROUP
+    return view
+
+
+# ── Batch mode: many views, one process per CSV ─────────────────────────────
+def batch_overrides(argv):
+    """Options given on the command line next to --batch, as {name: value}."""
+    unset   = object()
+    # append options get fresh lists, which argparse copies once they are used
+    markers = {name: [] if isinstance(value, list) else unset
+               for name, value in vars(parser.parse_args([])).items()}
+    args    = parser.parse_args(argv, argparse.Namespace(**markers))
+    if args.csv or args.group or args.excludes:
+        raise ValueError("With --batch, the CSV, group and excludes come from the manifest")
+    return {name: value for name, value in vars(args).items()
+            if value is not markers[name] and name not in ('csv', 'group', 'excludes', 'batch', 'jobs')}
+
+
+def load_manifest(manifestPath, overrides={}):
+    """Views listed in a --batch manifest, as parsed-argument namespaces;
+    `overrides` (see batch_overrides) replace the options of every view."""
+    entries = json.loads(Path(manifestPath).read_text(encoding='utf-8'))
+    views   = []
+    for entry in entries:
+        view    = parser.parse_args([])
+        unknown = set(entry) - set(vars(view)) - {'batch', 'jobs'}
+        if unknown:
+            raise ValueError(f"Unknown option(s) {', '.join(sorted(unknown))} in {entry!r}")
+        vars(view).update(entry)
+        vars(view).update(overrides)
+        conflict = layout_conflict(view)
+        if conflict:
+            raise ValueError(f"{conflict}, in {entry!r}")
+        views.append(with_defaults(view))
+
+    names = [view.name or Path(view.csv).stem for view in views]
+    clash = sorted({n for n in names if names.count(n) > 1})
+    if clash:
+        raise ValueError(f"Several views write to {', '.join(clash)}; give them distinct 'name's")
+    return views
+
+
+def plan_batch(views, jobs=None):
+    """Split views into per-process tasks.
+
+    Views of the same CSV share one read of the file, so each CSV is one
+    task. Only when --jobs asks for more workers than there are CSV files
+    are the views of a CSV spread over its share of them, trading an
+    extra read for parallelism.
+    """
+    byCsv = {}
+    for view in views:
+        byCsv.setdefault(view.csv, []).append(view)
+    tasks = []
+    for csvViews in byCsv.values():
+        share = 1
+        if jobs and jobs > len(byCsv):
+            share = max(1, min(len(csvViews), jobs * len(csvViews) // len(views)))
+        tasks.extend(csvViews[k::share] for k in range(share))
+    return tasks, len(byCsv)
+
+
+def run_batch(manifestPath, jobs=None, overrides={}):
+    """Build all views in the manifest in parallel worker processes."""
+    start   = time.perf_counter()
+    views   = load_manifest(manifestPath, overrides)
+    tasks, csvCount = plan_batch(views, jobs)
+    workers = max(1, min(jobs or os.cpu_count() or 1, len(tasks)))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        summaries = [s for batch in pool.map(build_views, tasks) for s in batch]
+
+    print()
+    print(f"{'view':<32} {'csv':<32} {'group':<20} {'rows':>10} {'seconds':>8} {'peak MB':>8}")
+    for s in summaries:
+        rss = '-' if s['rss'] is None else f"{s['rss']:.1f}"
+        print(f"{s['name']:<32} {s['csv']:<32} {s['group']:<20} {s['rows']:>10} {s['seconds']:>8.2f} {rss:>8}")
+    print(f"{len(summaries)} views from {csvCount} CSV files "
+          f"in {time.perf_counter() - start:.2f}s")
+    peaks = [s['rss'] for s in summaries if s['rss'] is not None]
+    if peaks:
+        print(f"Peak RSS: {max(peaks):.1f} MB (largest worker)")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.csv and not args.group and not args.batch:
+        parser.print_usage()
+        exit(1)
+    if not args.batch and layout_conflict(args):
+        parser.error(layout_conflict(args))
+
+    if args.batch:
+        run_batch(args.batch, args.jobs, batch_overrides(sys.argv[1:]))
+    else:
+        buildStart = time.perf_counter()
+        summary,   = build_views([with_defaults(args)])
+        print_report(summary['rows'], time.perf_counter() - buildStart)
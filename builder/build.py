@@ -2,6 +2,7 @@ import csv
 import json
 from distutils import dir_util
 import random
+import re
 from sys import argv
 from pathlib import Path
 
@@ -65,14 +66,17 @@ print(f"Wrote new json file {baseDir / 'files' / 'data.js'}\n")
 
 
 
-# Replace function using Python instead of sed
-def replace(s1, s2, filename):
+# Replace placeholders using Python instead of sed
+def render(filename, replacements):
+    """Substitute every placeholder in one pass and write the file once."""
     filename = Path(filename)
     content  = filename.read_text(encoding='utf-8')
-    filename.write_text(content.replace(s1, s2), encoding='utf-8')
+    pattern  = '|'.join(re.escape(k) for k in sorted(replacements, key=len, reverse=True))
+    content  = re.sub(rf'(?<!\w)(?:{pattern})(?!\w)', lambda m: replacements[m.group()], content)
+    filename.write_text(content, encoding='utf-8')
 
 
-# right after you detect firstRow, before your replace() calls:
+# right after you detect firstRow, before your render() calls:
 
 axis_order = [
     "State",
@@ -89,9 +93,6 @@ axis_order = [
 # filter out any excludes, just in case
 axis_order = [c for c in axis_order if c in firstRow and c not in excludes]
 
-# now inject that order into your JS
-replace('DIMENSIONS', json.dumps(axis_order), baseDir / 'files' / 'parallel-coordinates.js')
-
 
 # Detect column types
 print("Detected column types:")
@@ -108,12 +109,17 @@ for key, value in firstRow.items():
 colors = {i: f'#{random.randint(0, 0xFFFFFF):06x}' for i in groups}
 
 # Replace placeholders in files
-replace('COLORS',   json.dumps(colors) + ';',                 baseDir / 'index.html')
-replace('TITLE',    path,                                     baseDir / 'index.html')
-replace('GROUPS',   json.dumps(groups) + ';',                 baseDir / 'index.html')
-replace('GROUP',    groupColumn,                              baseDir / 'index.html')
-replace('ORDINALS', json.dumps(ordinals),                     baseDir / 'files' / 'parallel-coordinates.js')
-replace('EXCLUDES', json.dumps(excludes),                     baseDir / 'files' / 'parallel-coordinates.js')
-replace('GROUP',    groupColumn,                              baseDir / 'files' / 'parallel-coordinates.js')
+render(baseDir / 'index.html', {
+    'COLORS':     json.dumps(colors) + ';',
+    'TITLE':      path,
+    'GROUPS':     json.dumps(groups) + ';',
+    'GROUP':      groupColumn,
+})
+render(baseDir / 'files' / 'parallel-coordinates.js', {
+    'DIMENSIONS': json.dumps(axis_order),   # inject the axis order into the JS
+    'ORDINALS':   json.dumps(ordinals),
+    'EXCLUDES':   json.dumps(excludes),
+    'GROUP':      groupColumn,
+})
 
 print(f"Saved to: {baseDir}")
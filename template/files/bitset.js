@@ -0,0 +1,99 @@
+(function(root) {
+
+  // Fixed-size set of row ids backed by 32-bit words.
+  root.Bitset = function(size, words) {
+    var self = {},
+        n = (size + 31) >>> 5;
+
+    words = words || new Uint32Array(n);
+
+    self.size = size;
+    self.words = words;
+
+    self.set = function(i) {
+      words[i >>> 5] |= 1 << (i & 31);
+    };
+
+    self.unset = function(i) {
+      words[i >>> 5] &= ~(1 << (i & 31));
+    };
+
+    self.has = function(i) {
+      return (words[i >>> 5] & (1 << (i & 31))) !== 0;
+    };
+
+    // Set every id in [0, size)
+    self.fill = function() {
+      words.fill(0xFFFFFFFF);
+      if (size & 31) words[n - 1] = (1 << (size & 31)) - 1;
+      return self;
+    };
+
+    self.clear = function() {
+      words.fill(0);
+      return self;
+    };
+
+    self.copy = function(other) {
+      words.set(other.words);
+      return self;
+    };
+
+    self.and = function(other) {
+      var o = other.words;
+      for (var w = 0; w < n; w++) words[w] &= o[w];
+      return self;
+    };
+
+    self.andNot = function(other) {
+      var o = other.words;
+      for (var w = 0; w < n; w++) words[w] &= ~o[w];
+      return self;
+    };
+
+    self.or = function(other) {
+      var o = other.words;
+      for (var w = 0; w < n; w++) words[w] |= o[w];
+      return self;
+    };
+
+    self.count = function() {
+      var total = 0;
+      for (var w = 0; w < n; w++) {
+        var v = words[w];
+        v = v - ((v >>> 1) & 0x55555555);
+        v = (v & 0x33333333) + ((v >>> 2) & 0x33333333);
+        total += (((v + (v >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+      }
+      return total;
+    };
+
+    // Call fn(id) for every member, in increasing order
+    self.each = function(fn) {
+      for (var w = 0; w < n; w++) {
+        var v = words[w];
+        while (v !== 0) {
+          var t = v & -v;
+          fn((w << 5) + 31 - Math.clz32(t));
+          v ^= t;
+        }
+      }
+    };
+
+    self.toArray = function() {
+      var ids = new Array(self.count()),
+          k = 0;
+      self.each(function(i) { ids[k++] = i; });
+      return ids;
+    };
+
+    return self;
+  };
+
+  Bitset.fromArray = function(size, ids) {
+    var bits = Bitset(size);
+    for (var k = 0; k < ids.length; k++) bits.set(ids[k]);
+    return bits;
+  };
+
+})(this);
@@ -0,0 +1,126 @@
+(function(root) {
+
+  // Groups rows that are close together on the map into square cells of
+  // `cell` screen pixels at a zoom level, so the map draws one marker per
+  // cell instead of one per row. build.py writes the cells of every row
+  // for the lower zoom levels (`clusters` in files/stats.js); other sets
+  // of rows, and deeper zooms, are grouped here from each row's Web
+  // Mercator position, using the same grid.
+  root.MapClusters = function(store, lat, lon) {
+    var self = {},
+        built = store.stats && store.stats.clusters,
+        cell = built ? built.cell : 64,
+        x = null,    // world pixels at zoom 0 per row, NaN off the map
+        y = null,
+        lats = null,
+        lons = null;
+
+    store.appended(function() { x = null; });
+
+    // The cells of the rows `ids` at `zoom`. The result is updated in place
+    // by add(ids) / remove(ids) as rows enter and leave the set, so a brush
+    // move costs the rows that changed rather than the whole set; `rows`
+    // is the size of the set.
+    self.track = function(ids, zoom) {
+      var cells = Cells(zoom);
+      if (built && ids.length == store.length && zoom < built.levels.length) {
+        _(built.levels[zoom]).each(function(c) {
+          cells.byKey[c[0]] = { count: c[1], lat: c[2] * c[1], lon: c[3] * c[1], ids: c[4] };
+        });
+        cells.rows = ids.length;
+      } else {
+        cells.add(ids);
+      }
+      return cells;
+    };
+
+    // Position of a row as [lat, lon], or null if it has none
+    self.position = function(i) {
+      if (!x) project();
+      return x[i] === x[i] ? [lats[i], lons[i]] : null;
+    };
+
+    // Each cell keeps sums of its rows' positions and ids, so rows can be
+    // taken out again; the id sum is the row id once one row is left
+    function Cells(zoom) {
+      var cells = { zoom: zoom, rows: 0, byKey: {} },
+          scale = Math.pow(2, zoom) / cell,
+          width = Math.pow(2, zoom + 8) / cell;
+
+      function key(i) {
+        return Math.min(Math.floor(y[i] * scale), width - 1) * width +
+               Math.min(Math.floor(x[i] * scale), width - 1);
+      }
+
+      cells.add = function(ids) {
+        if (!x) project();
+        cells.rows += ids.length;
+        for (var k = 0; k < ids.length; k++) {
+          var i = ids[k];
+          if (x[i] !== x[i]) continue;
+          var at = key(i),
+              c = cells.byKey[at] || (cells.byKey[at] = { count: 0, lat: 0, lon: 0, ids: 0 });
+          c.count++;
+          c.lat += lats[i];
+          c.lon += lons[i];
+          c.ids += i;
+        }
+      };
+
+      cells.remove = function(ids) {
+        if (!x) project();
+        cells.rows -= ids.length;
+        for (var k = 0; k < ids.length; k++) {
+          var i = ids[k];
+          if (x[i] !== x[i]) continue;
+          var at = key(i),
+              c = cells.byKey[at];
+          if (!c) continue;
+          if (--c.count == 0) {
+            delete cells.byKey[at];
+            continue;
+          }
+          c.lat -= lats[i];
+          c.lon -= lons[i];
+          c.ids -= i;
+        }
+      };
+
+      // Call fn({key, count, lat, lon, id}) for every cell: `lat` / `lon`
+      // are the mean position of its rows and `id` the row of a single-row
+      // cell (-1 otherwise)
+      cells.each = function(fn) {
+        _(cells.byKey).each(function(c, key) {
+          fn({ key: key, count: c.count, lat: c.lat / c.count, lon: c.lon / c.count,
+               id: c.count == 1 ? c.ids : -1 });
+        });
+      };
+
+      return cells;
+    }
+
+    function project() {
+      x = new Float64Array(store.length).fill(NaN);
+      y = new Float64Array(store.length);
+      lats = new Float64Array(store.length);
+      lons = new Float64Array(store.length);
+      for (var i = 0; i < store.loaded; i++) {
+        var la = number(store.value(lat, i)),
+            lo = number(store.value(lon, i));
+        if (!(la >= -90 && la <= 90 && lo >= -180 && lo <= 180)) continue;
+        var s = Math.sin(Math.max(-85.0511287798, Math.min(85.0511287798, la)) * Math.PI / 180);
+        x[i] = (lo + 180) / 360 * 256;
+        y[i] = (0.5 - Math.log((1 + s) / (1 - s)) / (4 * Math.PI)) * 256;
+        lats[i] = la;
+        lons[i] = lo;
+      }
+    }
+
+    function number(v) {
+      return v === null || v === '' ? NaN : +v;
+    }
+
+    return self;
+  };
+
+})(this);
@@ -0,0 +1,295 @@
+(function(root) {
+
+  // Crossfilter-style brush engine over a ColumnStore.
+  //
+  // Every brushed axis keeps its own cached bitset. When a numeric brush
+  // moves, only the rows between the old and new ends of the brush (in the
+  // column's sorted order) are flipped. The AND of all other axes is cached
+  // as well, so dragging one brush costs one bitset AND plus the rows that
+  // actually changed. Each run reports which rows entered and left the
+  // filtered set.
+  //
+  // Filters are plain data so the engine can also run inside a worker:
+  //   numeric axis: {min: 2.5, max: 40}
+  //   ordinal axis: {codes: [0, 3, 4]}
+  //
+  // `initial`, if given, is the filtered set the caller already shows; the
+  // first run then reports only the rows that differ from it.
+  root.FilterEngine = function(store, initial) {
+    var self = {},
+        size = store.length,
+        dataMask = Bitset(size).fill(),
+        axes = {},
+        current = initial || null,
+        others = null,
+        othersKey = null,
+        dirty = true;
+
+    // Restrict filtering to the given row ids (after keep / remove)
+    self.setData = function(ids) {
+      dataMask = Bitset.fromArray(size, ids);
+      others = null;
+      dirty = true;
+    };
+
+    // Rows were appended to the store: the cached axis bitsets and the
+    // store's indexes only cover the old rows, so every axis is rebuilt on
+    // the next run. The caller widens the working set with setData.
+    self.append = function() {
+      axes = {};
+      others = null;
+      dirty = true;
+    };
+
+    self.dataMask = function() {
+      return dataMask;
+    };
+
+    self.current = function() {
+      return current;
+    };
+
+    // Apply `filter` ({key: range}). Returns {mask, added, removed}, or null
+    // when nothing changed since the previous run.
+    self.run = function(filter) {
+      var changed = [];
+
+      for (var key in axes) {
+        if (!(key in filter)) {
+          delete axes[key];
+          changed.push(key);
+        }
+      }
+      for (var key in filter) {
+        if (updateAxis(key, filter[key])) changed.push(key);
+      }
+      if (!changed.length && !dirty && current) return null;
+
+      var mask;
+      if (changed.length == 1 && !dirty && axes[changed[0]]) {
+        // one brush moved: AND it with the cached product of the others
+        if (!others || othersKey != changed[0]) {
+          others = Bitset(size).copy(dataMask);
+          for (var key in axes) {
+            if (key != changed[0]) others.and(axes[key].bits);
+          }
+          othersKey = changed[0];
+        }
+        mask = Bitset(size).copy(others).and(axes[changed[0]].bits);
+      } else {
+        others = null;
+        mask = Bitset(size).copy(dataMask);
+        for (var key in axes) mask.and(axes[key].bits);
+      }
+
+      var result = diff(current, mask);
+      current = mask;
+      dirty = false;
+      return result;
+    };
+
+    // Bring the cached bitset for one axis up to date; true if it changed
+    function updateAxis(key, range) {
+      var axis = axes[key],
+          index = store.index(key),
+          order = index.order;
+
+      if (range.codes) {
+        var signature = range.codes.join(',');
+        if (axis && axis.signature === signature) return false;
+        var bits = Bitset(size);
+        for (var c = 0; c < range.codes.length; c++) {
+          var code = range.codes[c];
+          for (var k = index.offsets[code]; k < index.offsets[code + 1]; k++) bits.set(order[k]);
+        }
+        axes[key] = { signature: signature, bits: bits };
+        return true;
+      }
+
+      var values = index.values,
+          lo = lowerBound(order, function(i) { return values[i] < range.min; }),
+          hi = lowerBound(order, function(i) { return values[i] <= range.max; });
+
+      var created = !axis;
+      if (created) {
+        axis = axes[key] = { bits: Bitset(size), lo: lo, hi: lo };
+      }
+      if (axis.lo == lo && axis.hi == hi) return created;
+
+      // drop rows that left the brush, then add rows that entered it
+      flip(order, axis.lo, Math.min(axis.hi, lo), axis.bits.unset);
+      flip(order, Math.max(axis.lo, hi), axis.hi, axis.bits.unset);
+      flip(order, lo, Math.min(hi, axis.lo), axis.bits.set);
+      flip(order, Math.max(lo, axis.hi), hi, axis.bits.set);
+      axis.lo = lo;
+      axis.hi = hi;
+      return true;
+    }
+
+    function flip(order, from, to, fn) {
+      for (var k = from; k < to; k++) fn(order[k]);
+    }
+
+    // first position in `order` for which `before` is false
+    function lowerBound(order, before) {
+      var a = 0, b = order.length;
+      while (a < b) {
+        var mid = (a + b) >>> 1;
+        if (before(order[mid])) a = mid + 1; else b = mid;
+      }
+      return a;
+    }
+
+    // rows that entered / left the filtered set between two masks
+    function diff(before, after) {
+      var added = [], removed = [],
+          a = after.words,
+          b = before ? before.words : new Uint32Array(a.length);
+      for (var w = 0; w < a.length; w++) {
+        if (a[w] === b[w]) continue;
+        collect(a[w] & ~b[w], w, added);
+        collect(b[w] & ~a[w], w, removed);
+      }
+      return { mask: after, added: added, removed: removed };
+    }
+
+    function collect(v, w, out) {
+      while (v !== 0) {
+        var t = v & -v;
+        out.push((w << 5) + 31 - Math.clz32(t));
+        v ^= t;
+      }
+    }
+
+    return self;
+  };
+
+  // Asynchronous front-ends used by the Filter model. Both expose
+  //   setData(ids), append(from, to), setGroup(name), run(filter, callback),
+  //   dataMask(), current()
+  // and call back with {mask, added, removed[, counts]} or null.
+
+  // Runs the engine on the calling thread
+  FilterEngine.local = function(store, current) {
+    var engine = FilterEngine(store, current);
+    return {
+      setData: engine.setData,
+      append: engine.append,
+      setGroup: function() {},   // no group counts on this thread
+      dataMask: engine.dataMask,
+      current: engine.current,
+      run: function(filter, callback) { callback(engine.run(filter)); }
+    };
+  };
+
+  // Runs the engine and the group counts in files/worker.js. Only the
+  // newest filter is sent while a run is in flight; intermediate brush
+  // positions are dropped. Falls back to the local engine if the worker
+  // cannot start (e.g. pages opened from file://).
+  FilterEngine.worker = function(store, group) {
+    var self = {},
+        size = store.length,
+        worker,
+        local = null,
+        dataMask = Bitset(size).fill(),
+        current = null,
+        groups = [],
+        seq = 0,
+        busy = false,
+        latest = null,
+        queued = null,
+        regrouping = false,
+        callback = null;
+
+    try {
+      worker = new Worker('files/worker.js');
+    } catch (e) {
+      return FilterEngine.local(store);
+    }
+
+    worker.onerror = function(e) {
+      e.preventDefault();
+      if (local) return;
+      // Carry on from what the page shows: the last result or, before the
+      // first one, every row (the pie starts from the counts of all data).
+      // Views keep patching themselves from deltas against that set.
+      local = FilterEngine.local(store, current || Bitset(size).copy(dataMask));
+      local.setData(dataMask.toArray());
+      if (latest) local.run(latest, callback);
+    };
+
+    worker.onmessage = function(e) {
+      var msg = e.data;
+      if (msg.type == 'ready') {
+        groups = msg.groups;
+        regrouping = false;
+        return;
+      }
+      busy = false;
+      var cb = callback;
+      if (msg.changed) {
+        current = Bitset(size, msg.words);
+        var result = { mask: current, added: msg.added, removed: msg.removed };
+        // counts of a run started before a regroup are by the old column
+        if (!regrouping) {
+          result.counts = {};
+          for (var c = 0; c < msg.counts.length; c++) {
+            if (msg.counts[c]) result.counts[groups[c]] = msg.counts[c];
+          }
+        }
+        cb(result);
+      }
+      if (queued) {
+        var next = queued;
+        queued = null;
+        send(next);
+      }
+    };
+
+    worker.postMessage({ type: 'init', length: size, columns: _(store.names).map(store.column), group: group });
+
+    function send(filter) {
+      busy = true;
+      worker.postMessage({ type: 'run', id: ++seq, filter: filter });
+    }
+
+    self.setData = function(ids) {
+      dataMask = Bitset.fromArray(size, ids);
+      if (local) return local.setData(ids);
+      var copy = Int32Array.from(ids);
+      worker.postMessage({ type: 'data', ids: copy }, [copy.buffer]);
+    };
+
+    // The worker holds its own copy of the columns; send it the new rows
+    self.append = function(from, to) {
+      if (local) return local.append(from, to);
+      var chunk = store.slice(from, to);
+      worker.postMessage({ type: 'append', chunk: chunk }, _(chunk.columns).pluck('buffer'));
+    };
+
+    // Count rows by another column from the next run on
+    self.setGroup = function(name) {
+      if (local) return local.setGroup(name);
+      regrouping = true;
+      worker.postMessage({ type: 'group', group: name });
+    };
+
+    self.dataMask = function() {
+      return local ? local.dataMask() : dataMask;
+    };
+
+    self.current = function() {
+      return local ? local.current() : current;
+    };
+
+    self.run = function(filter, cb) {
+      if (local) return local.run(filter, cb);
+      callback = cb;
+      latest = filter;
+      if (busy) queued = filter; else send(filter);
+    };
+
+    return self;
+  };
+
+})(this);
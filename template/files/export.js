@@ -0,0 +1,71 @@
+(function(root) {
+
+  var CHUNK = 5000;  // rows formatted per step
+
+  // Download the rows `ids` of the store as CSV. The file is assembled as
+  // a Blob from one string per CHUNK rows, read straight from the columns,
+  // with a pause between chunks so the page stays responsive; nothing is
+  // ever held as one big string or URL. With `gzip` (where the browser has
+  // CompressionStream) the Blob is compressed on the way out.
+  root.exportRows = function(store, ids, name, gzip, done) {
+    var formats = _(store.names).map(function(name) { return formatter(store.column(name)); }),
+        parts = [_(store.names).map(quote).join(",")],
+        next = 0;
+
+    (function step() {
+      var end = Math.min(next + CHUNK, ids.length),
+          lines = [];
+      for (; next < end; next++) {
+        var i = ids[next],
+            cells = new Array(formats.length);
+        for (var c = 0; c < formats.length; c++) cells[c] = formats[c](i);
+        lines.push(cells.join(","));
+      }
+      if (lines.length) parts.push("\n" + lines.join("\n"));
+      if (next < ids.length) return setTimeout(step, 0);
+
+      var blob = new Blob(parts, { type: "text/csv" });
+      if (gzip && root.CompressionStream) {
+        new Response(blob.stream().pipeThrough(new CompressionStream("gzip"))).blob().then(function(packed) {
+          save(packed, name + ".csv.gz");
+          if (done) done();
+        });
+        return;
+      }
+      save(blob, name + ".csv");
+      if (done) done();
+    })();
+  };
+
+  exportRows.gzip = !!root.CompressionStream;
+
+  // Cell text for one column, as the old export wrote it: text quoted,
+  // numbers bare, missing numbers empty (or their text, see store.row)
+  function formatter(col) {
+    if (col.type == 'ordinal') {
+      var quoted = _(col.domain).map(quote);
+      return function(i) { return quoted[col.codes[i]]; };
+    }
+    var float32 = col.values instanceof Float32Array;
+    return function(i) {
+      var v = col.values[i];
+      if (v !== v) return col.text && i in col.text ? quote(col.text[i]) : "";
+      return String(float32 ? +v.toPrecision(7) : v);
+    };
+  }
+
+  function quote(s) {
+    return '"' + String(s).replace(/\"/g, "\"\"").replace(/\0/g, "\\0") + '"';
+  }
+
+  function save(blob, filename) {
+    var link = document.createElement("a");
+    link.href = URL.createObjectURL(blob);
+    link.download = filename;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    setTimeout(function() { URL.revokeObjectURL(link.href); }, 10000);
+  }
+
+})(this);
@@ -23,11 +23,17 @@
     initialize: function() {
       // apply filter when data or filter changes
       this.bind('change:data', function() {
+        this.engine = this.engine || this.createEngine();
+        this.engine.setData(this.get('data'));
         this.run();
       });
       this.bind('change:filter', function() {
         this.run();
       });
+      // the worker counts rows per group for the pie
+      this.bind('change:group', function() {
+        if (this.engine) this.engine.setGroup(this.get('group'));
+      });
     },
   
     add: function(filter) {
@@ -47,55 +53,88 @@
       this.trigger('change:filter');  // why necessary?
     },
 
+    // Rows [from, to) were appended to the store by progressive loading;
+    // they join the working set and the filter runs again
+    append: function(from, to) {
+      this.engine = this.engine || this.createEngine();
+      this.engine.append(from, to);
+      this.set({data: this.get('data').concat(_.range(from, to))});
+    },
+
+    // Filtering and group counts run in a Web Worker when the page is
+    // served over http(s); pages opened from file:// cannot start workers
+    createEngine: function() {
+      var store = this.get('store');
+      if (window.Worker && location.protocol != 'file:') {
+        return FilterEngine.worker(store, this.get('group'));
+      }
+      return FilterEngine.local(store);
+    },
+
+    // `data` and `filtered` hold row ids into the ColumnStore in `store`.
+    // Filtering is done by FilterEngine on per-axis bitsets; a 'delta' event
+    // with the rows that entered / left the filtered set (and, from the
+    // worker, per-group `counts`) fires before `filtered` changes, so views
+    // can patch themselves instead of rebuilding.
     run: function() {
       var self = this;
-      var filtered = _(self.get('data')).filter(function(d,k) {
-        return self.check(d);
+      this.engine.run(this.ranges(), function(result) {
+        if (!result) return;
+        self.trigger('delta', result);
+        self.set({filtered: result.mask.toArray()});
       });
-      this.set({filtered: filtered});
     },
 
-    outliers: function() {
-      var self = this;
-      var leftovers = _(self.get('data')).reject(function(d,k) {
-        return self.check(d);
+    // The filter as plain ranges for the engine; ordinal brushes become the
+    // list of dictionary codes behind the axis categories inside the brush
+    ranges: function() {
+      var filter = this.get('filter'),
+          store = this.get('store'),
+          ranges = {};
+      _(filter).each(function(range, key) {
+        if (!range.scale) { // adding crude support for ordinals
+          ranges[key] = { min: range.min, max: range.max };
+          return;
+        }
+        var codes = [];
+        _(range.scale.domain()).each(function(value) {
+          var pos = range.scale(value);
+          if (pos >= range.min && pos <= range.max) codes.push.apply(codes, store.axisCodes(key, value));
+        });
+        ranges[key] = { codes: codes };
       });
+      return ranges;
+    },
+
+    // Bitset of the rows in `data` that passed the last completed run
+    mask: function() {
+      return this.engine.current();
+    },
+
+    outliers: function() {
+      var data = this.engine.dataMask();
+      var leftovers = Bitset(data.size).copy(data).andNot(this.mask()).toArray();
       if (_(leftovers).size() === 0) {
         if (!confirm("This will remove all the data. Are you sure about this?"))
           return false;
       }
-      self.set({data: leftovers});
-      self.clearFilter();
+      this.set({data: leftovers});
+      this.clearFilter();
     },
     
     inliers: function() {
-      var self = this;
-      var leftovers = _(self.get('data')).filter(function(d,k) {
-        return self.check(d);
-      });
+      var leftovers = this.mask().toArray();
       if (_(leftovers).size() === 0) {
         if (!confirm("This will remove all the data. Are you sure about this?"))
           return false;
       }
-      self.set({data: leftovers});
-      self.clearFilter();
+      this.set({data: leftovers});
+      this.clearFilter();
     },
     
     clearFilter: function() {
       this.set({filter: {}});
       this.trigger('change:filter');  // why necessary?
-    },
-
-    check: function(d) {
-      var filter = this.get('filter')
-      for (key in this.get('filter')) {
-        if (filter[key].scale) { // adding crude support for ordinals
-          if ((filter[key].scale(d[key]) < filter[key].min) || (filter[key].scale(d[key]) > filter[key].max))
-            return false;
-        } else if ((d[key] < filter[key].min) || (d[key] > filter[key].max))
-          return false;
-      }
-      return true;
     }
 
   });
@@ -16,6 +16,74 @@
 
 (function(undefined) {
 
+  // Feeds Slick.Grid from the filtered row ids, which are the stable
+  // ColumnStore row indexes. Rows are materialised only when the grid
+  // draws them, and kept by id, so a filter change costs the rows on
+  // screen rather than the whole filtered set. Provides the part of
+  // Slick.Data.DataView that the grid and the pager use.
+  function RowFeed(store) {
+    var feed = {},
+        ids = [],
+        pageSize = 0,
+        pageNum = 0,
+        rows = {},
+        cached = 0;
+
+    feed.onPagingInfoChanged = new Slick.Event();
+
+    // Show these row ids (ascending)
+    feed.setIds = function(next) {
+      ids = next;
+      if (pageSize) pageNum = Math.max(0, Math.min(pageNum, Math.ceil(ids.length / pageSize) - 1));
+      feed.onPagingInfoChanged.notify(feed.getPagingInfo(), null, feed);
+    };
+
+    feed.getIds = function() {
+      return ids;
+    };
+
+    // Position in `ids` of the first row on the current page
+    feed.offset = function() {
+      return pageSize * pageNum;
+    };
+
+    feed.getLength = function() {
+      return pageSize ? Math.max(0, Math.min(pageSize, ids.length - feed.offset())) : ids.length;
+    };
+
+    feed.getItem = function(r) {
+      var i = ids[feed.offset() + r];
+      if (i === undefined) return undefined;
+      if (!(i in rows)) {
+        if (cached++ > 2000) {   // a few screens' worth; drop the rest
+          rows = {};
+          cached = 1;
+        }
+        rows[i] = store.row(i);
+        rows[i].id = i;
+      }
+      return rows[i];
+    };
+
+    // Grid row of a row id, or -1 when it is not on the current page
+    feed.getRowById = function(i) {
+      var k = _(ids).sortedIndex(i) - feed.offset();
+      return ids[k + feed.offset()] === i && k >= 0 && k < feed.getLength() ? k : -1;
+    };
+
+    feed.getPagingInfo = function() {
+      return { pageSize: pageSize, pageNum: pageNum, totalRows: ids.length };
+    };
+
+    feed.setPagingOptions = function(args) {
+      if (args.pageSize != undefined) pageSize = args.pageSize;
+      if (args.pageNum != undefined) pageNum = args.pageNum;
+      feed.setIds(ids);
+    };
+
+    return feed;
+  }
+
   window.grid = Backbone.View.extend({
 
     initialize: function(options) {
@@ -23,7 +91,7 @@
       for (var k in options) {
         this[k] = options[k];
       }
-      this.model.bind('change:filtered', function() { self.update()});
+      this.model.bind('change:filtered', function() { self.update(); });
       this.cols = _(this.columns).map(function(col) {
         return {
           id: col,
@@ -38,30 +106,25 @@
         enableColumnReorder: true
       };
 
-      this.dataView = new Slick.Data.DataView();
+      this.feed = new RowFeed(this.model.get('store'));
       this.selectedRowIds = [];
-      this.grid = new Slick.Grid("#myGrid", this.dataView, this.cols, this.options);
-      this.counter = 0;
+      this.grid = new Slick.Grid("#myGrid", this.feed, this.cols, this.options);
 
-      var pager = new Slick.Controls.Pager(this.dataView, this.grid, $("#pager"));
+      var pager = new Slick.Controls.Pager(this.feed, this.grid, $("#pager"));
 
-      this.dataView.onRowCountChanged.subscribe(function(e,args) {
+      // Only the rows on screen are redrawn; the selection follows its
+      // row ids to wherever they are now
+      this.feed.onPagingInfoChanged.subscribe(function(e,pagingInfo) {
         self.grid.updateRowCount();
-        self.grid.render();
-      });
-
-      this.dataView.onRowsChanged.subscribe(function(e,args) {
-        self.grid.invalidateRows(args.rows);
+        self.grid.invalidateAllRows();
         self.grid.render();
 
         if (self.selectedRowIds.length > 0) {
-          // since how the original data maps onto rows has changed,
-          // the selected rows in the grid need to be updated
           var selRows = [];
           for (var i = 0; i < self.selectedRowIds.length; i++)
           {
-            var idx = self.dataView.getRowById(self.selectedRowIds[i]);
-            if (idx != undefined)
+            var idx = self.feed.getRowById(self.selectedRowIds[i]);
+            if (idx >= 0)
               selRows.push(idx);
           }
 
@@ -69,13 +132,8 @@
         }
       });
 
-      this.dataView.onPagingInfoChanged.subscribe(function(e,pagingInfo) {
-        var isLastPage = pagingInfo.pageSize*(pagingInfo.pageNum+1)-1 >= pagingInfo.totalRows;
-        var enableAddRow = isLastPage || pagingInfo.pageSize==0;
-        var options = self.grid.getOptions();
-
-        if (options.enableAddRow != enableAddRow)
-          self.grid.setOptions({enableAddRow:enableAddRow});
+      this.grid.onSelectedRowsChanged.subscribe(function(e,args) {
+        self.selectedRowIds = _(args.rows).map(function(row) { return self.feed.getItem(row).id; });
       });
 
       this.grid.onColumnsReordered.subscribe(function(e,args) {
@@ -83,10 +141,11 @@
         self.trigger('columnsReordered', columns);
       });
       
+      // The selector holds a position in the filtered rows
       if (this.selector) {
         var selected = undefined;
         this.grid.onMouseEnter.subscribe(function(e,args) {
-          selected = self.grid.getCellFromEvent(e).row;
+          selected = self.feed.offset() + self.grid.getCellFromEvent(e).row;
           self.selector.select(selected);
         });
         this.grid.onMouseLeave.subscribe(function(e,args) {
@@ -99,15 +158,10 @@
         });
       }
     },
+    // The filter already holds the ids in order, so the grid only has to
+    // redraw what is on screen
     update: function() {
-      var self = this;
-      var data = _(this.model.get('filtered')).map(function(obj) {
-        obj.id = self.counter++;
-        return obj;
-      });
-      this.dataView.beginUpdate();
-      this.dataView.setItems(data);
-      this.dataView.endUpdate();
+      this.feed.setIds(this.model.get('filtered') || []);
     }
   });
 
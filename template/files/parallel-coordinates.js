@@ -5,23 +5,88 @@
         dimensions,
         dragging = {},
         highlighted = null,
+        hovered = [],
         container = d3.select("#parallel");
 
+    // 'svg' draws one <path> per row; 'canvas' draws rows in batches onto
+    // canvas layers underneath the SVG axes and brushes; 'density' uses the
+    // same layers but shades bands between neighbouring axes from 2-D
+    // histograms (see store.density). Chosen by build.py.
+    var renderer = 'RENDERER',
+        layered = renderer != 'svg';
+
     var line = d3.svg.line().interpolate('cardinal').tension(0.85),
         axis = d3.svg.axis().orient("left"),
         background,
         foreground;
-  
-    var myData = model.get('data');
+
+    var store = model.get('store'),
+        myData = model.get('data');   // row ids into the store
 
     self.update = function(data) {
       myData = data;
     };
-    
+
+    // Lines are coloured by the model's group column; an ordinal column
+    // looks its colours up by code. Called again when the page switches
+    // grouping, which redraws the lines in the new colours.
+    var group, color;
+    self.recolor = function(newColors) {
+      colors = newColors;
+      group = model.get('group');
+      var col = store.column(group);
+      if (col && col.type == 'ordinal') {
+        var swatches = _(col.domain).map(function(v) { return colors[v]; });
+        color = function(i) { return swatches[col.codes[i]]; };
+      } else {
+        color = function(i) { return colors[store.value(group, i)]; };
+      }
+      if (foreground) self.render();
+      return self;
+    };
+    self.recolor(colors);
+
+    // Rows [from, to) were appended to the store while the page is loading
+    // progressively and `data` now includes them. The canvas renderer
+    // strokes only the new rows onto the layers it already has; the SVG
+    // renderer has to rebuild its paths.
+    self.append = function(data, from, to) {
+      myData = data;
+      if (!layered || !background) return self.render();
+      if (renderer == 'density') return background.draw(myData);
+      background.add(_.range(from, to));
+    };
+
+    // Called with a row id when the pointer is over a line, undefined when
+    // it leaves (canvas renderer only; SVG paths get no hover events)
+    self.hover = function(fn) {
+      hovered.push(fn);
+    };
+
+    // Large selections are drawn from the build-time sample (see
+    // store.sample); once the brushes leave fewer rows than the sample
+    // holds, every filtered row is drawn
+    if (layered) {
+      model.bind('change:filtered', function() {
+        if (foreground) foreground.draw(lines(model.get('filtered')));
+      });
+    }
+
+    function lines(ids) {
+      return renderer == 'canvas' ? store.sample(ids) : ids;
+    }
+
+    // Number of foreground lines currently drawn
+    self.drawn = function() {
+      if (layered && foreground) return foreground.rows().length;
+      return (model.get('filtered') || myData).length;
+    };
+
     self.render = function() {
-    
+
       container.select("svg").remove();
-      
+      container.selectAll("canvas").remove();
+
       var bounds = [ $(container[0]).width(), $(container[0]).height() ],
           m = [30, 10, 10, 10],
           w = bounds[0] - m[1] - m[3],
@@ -30,51 +95,71 @@
       var x = d3.scale.ordinal().rangePoints([0, w], 1),
           y = {};
 
+      if (layered) {
+        container.style("position", "relative");
+        var layers = {
+          background: canvasLayer(),
+          foreground: canvasLayer(),
+          highlight: canvasLayer()
+        };
+      }
+
       var svg = container.append("svg:svg")
           .attr("width", w + m[1] + m[3])
           .attr("height", h + m[0] + m[2])
+          .style("position", "relative")
         .append("svg:g")
           .attr("transform", "translate(" + m[3] + "," + m[0] + ")");
 
       // Extract the list of dimensions and create a scale for each.
       // Excludes axis from diagram
-      x.domain(dimensions = d3.keys(myData[0]).filter(function(d) {
+      x.domain(dimensions = store.names.filter(function(d) {
 
-        var excludes = EXCLUDES;  
+        var excludes = EXCLUDES;
         var ex = d != "id" && (excludes.indexOf(d) < 0);
 
         // ordinal categories
-        if (ORDINALS.indexOf(d) >= 0) {
+        if (store.isOrdinal(d)) {
           return ex &&
             (y[d] = d3.scale.ordinal()
-            .domain(myData.map(function(p) { return p[d]; }))
+            .domain(store.categories(d, myData))
             .rangePoints([0, h]));
         }
         // linear axes
         return ex &&
           (y[d] = d3.scale.linear()
-          .domain(d3.extent(myData, function(p) { return +p[d]; }))
+          .domain(store.extent(d, myData))
           .range([h, 0]));
       }));
-      
-      // Add grey background lines for context.
-      background = svg.append("svg:g")
-          .attr("class", "background")
-        .selectAll("path")
-          .data(myData)
-        .enter().append("svg:path")
-          .attr("d", path);
-
-      // Add blue foreground lines for focus.
-      foreground = svg.append("svg:g")
-          .attr("class", "foreground")
-        .selectAll("path")
-          .data(myData)
-        .enter().append("svg:path")
-          .attr("d", path)
-          .attr("style", function(d) {
-            return "stroke:" + colors[d["GROUP"]] + ";";
-          });
+
+      if (layered) {
+        background = layers.background;
+        foreground = layers.foreground;
+        background.draw(myData);
+        foreground.draw(lines(model.get('filtered') || myData));
+        if (renderer == 'canvas') {
+          container.on("mousemove", hitTest).on("mouseout", function() { hover(undefined); });
+        }
+      } else {
+        // Add grey background lines for context.
+        background = svg.append("svg:g")
+            .attr("class", "background")
+          .selectAll("path")
+            .data(myData)
+          .enter().append("svg:path")
+            .attr("d", path);
+
+        // Add blue foreground lines for focus.
+        foreground = svg.append("svg:g")
+            .attr("class", "foreground")
+          .selectAll("path")
+            .data(myData)
+          .enter().append("svg:path")
+            .attr("d", path)
+            .attr("style", function(i) {
+              return "stroke:" + color(i) + ";";
+            });
+      }
 
       // Add a group element for each dimension.
       var g = svg.selectAll(".dimension")
@@ -100,6 +185,10 @@
               transition(d3.select(this)).attr("transform", "translate(" + x(d) + ")");
               transition(foreground)
                   .attr("d", path);
+              if (layered) {
+                background.attr("d", path).attr("visibility", null);
+                return;
+              }
               background
                   .attr("d", path)
                   .transition()
@@ -117,6 +206,28 @@
           .attr("y", -9)
           .text(String);
 
+      // Add the distribution of each numeric axis from the build-time
+      // histograms (only while the axes span every row)
+      if (myData.length == store.length) {
+        g.each(function(d) {
+          var hist = store.histogram(d);
+          if (!hist || y[d].rangeExtent) return;
+          var step = (hist.max - hist.min) / hist.bins.length,
+              most = d3.max(hist.bins) || 1;
+          d3.select(this).append("svg:g")
+              .attr("class", "histogram")
+            .selectAll("rect")
+              .data(hist.bins)
+            .enter().append("svg:rect")
+              .attr("x", function(n) { return -1 - 10 * n / most; })
+              .attr("width", function(n) { return 10 * n / most; })
+              .attr("y", function(n, k) { return y[d](hist.min + (k + 1) * step); })
+              .attr("height", function(n, k) {
+                return Math.max(0, y[d](hist.min + k * step) - y[d](hist.min + (k + 1) * step));
+              });
+        });
+      }
+
       // Add and store a brush for each axis.
       g.append("svg:g")
           .attr("class", "brush")
@@ -124,27 +235,27 @@
         .selectAll("rect")
           .attr("x", -12)
           .attr("width", 24);
-      
+
       function position(d) {
         var v = dragging[d];
         return v == null ? x(d) : v;
       }
-      
-      // Returns the path for a given data point.
-      function path(d) {
-        return line(dimensions.map(function(p) { return [position(p), y[p](d[p])]; }));
+
+      // Returns the path for a given row id.
+      function path(i) {
+        return line(dimensions.map(function(p) { return [position(p), y[p](store.axisValue(p, i))]; }));
       }
-      
+
       // Handles a brush event, toggling the display of foreground lines.
       function brush() {
         var actives = dimensions.filter(function(p) {
           return !y[p].brush.empty();
          })
-         
+
         var extents = actives.map(function(p) {
           return y[p].brush.extent();
         });
-        
+
         /** To be factored **/
         var filter = {};
         _(actives).each(function(key, i) {
@@ -159,22 +270,194 @@
         });
         model.set({filter: filter});
         /***/
+        if (layered) return;  // redrawn on change:filtered
         foreground.style("display", function(d) {
           return actives.every(function(p, i) {
+            var v = store.axisValue(p, d);
             return y[p].rangeExtent ?
 			  // ordinal
-	            extents[i][0] <= y[p](d[p]) && y[p](d[p]) <= extents[i][1] :
+	            extents[i][0] <= y[p](v) && y[p](v) <= extents[i][1] :
 			  // quantitative
-	            extents[i][0] <= d[p] && d[p] <= extents[i][1];
+	            extents[i][0] <= v && v <= extents[i][1];
           }) ? null : "none";
         });
       }
-      
+
       function transition(g) {
-        return g.transition().duration(500);
+        return g.transition ? g.transition().duration(500) : g;
       }
-      
+
+      // A canvas stacked under the SVG overlay that mimics the parts of the
+      // d3 selection API used above (attr "d" / "visibility"), drawing its
+      // rows progressively in batches so the page stays responsive.
+      function canvasLayer() {
+        var ratio = window.devicePixelRatio || 1,
+            canvas = document.createElement("canvas"),
+            ctx = canvas.getContext("2d"),
+            rows = [],
+            next = 0,
+            job = null,
+            layer = {};
+
+        canvas.width = (w + m[1] + m[3]) * ratio;
+        canvas.height = (h + m[0] + m[2]) * ratio;
+        canvas.style.cssText = "position:absolute; left:0; top:0; pointer-events:none;" +
+                               "width:" + (w + m[1] + m[3]) + "px; height:" + (h + m[0] + m[2]) + "px";
+        container[0][0].appendChild(canvas);
+
+        layer.canvas = canvas;
+
+        layer.draw = function(ids, style) {
+          rows = ids;
+          layer.style = style || layer.style;
+          if (job) cancelAnimationFrame(job);
+          ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+          ctx.clearRect(0, 0, w + m[1] + m[3], h + m[0] + m[2]);
+          ctx.translate(m[3], m[0]);
+          next = 0;
+          if (layer === background && !$('body').hasClass('shadows')) return layer;
+          if (renderer == 'density' && layer !== layers.highlight) return bands();
+          batch();
+          return layer;
+        };
+
+        // Draw more rows over what is already on the layer
+        layer.add = function(ids) {
+          rows = rows.concat(ids);
+          if (layer === background && !$('body').hasClass('shadows')) return layer;
+          if (!job) batch();
+          return layer;
+        };
+
+        function batch() {
+          var until = Date.now() + 12;
+          while (next < rows.length && Date.now() < until) {
+            var end = Math.min(next + 500, rows.length);
+            for (; next < end; next++) stroke(rows[next]);
+          }
+          job = next < rows.length ? requestAnimationFrame(batch) : null;
+        }
+
+        // Shade one band per non-empty cell of each neighbouring axis pair,
+        // per group (or for all rows, see store.density), with opacity on a
+        // log scale of the row count
+        function bands() {
+          for (var k = 0; k + 1 < dimensions.length; k++) {
+            var a = dimensions[k], b = dimensions[k + 1],
+                tile = store.density(a, b, rows, group);
+            if (!tile) continue;
+            var nb = tile.sizes[1],
+                most = 1,
+                xa = position(a),
+                xb = position(b);
+            _(tile.counts).each(function(cells) {
+              for (var j = 1; j < cells.length; j += 2) most = Math.max(most, cells[j]);
+            });
+            _(tile.counts).each(function(cells, value) {
+              ctx.fillStyle = layer === background ?
+                ($('body').hasClass('inverted') ? "#272727" : "#d4d4d4") :
+                tile.total ? "darkolivegreen" : colors[value] || "darkolivegreen";
+              for (var j = 0; j < cells.length; j += 2) {
+                var c = cells[j], n = cells[j + 1],
+                    sa = span(a, Math.floor(c / nb)), sb = span(b, c % nb);
+                if (!sa || !sb) continue;
+                ctx.globalAlpha = 0.05 + 0.6 * Math.log(1 + n) / Math.log(1 + most);
+                ctx.beginPath();
+                ctx.moveTo(xa, sa[0]);
+                ctx.lineTo(xb, sb[0]);
+                ctx.lineTo(xb, sb[1]);
+                ctx.lineTo(xa, sa[1]);
+                ctx.closePath();
+                ctx.fill();
+              }
+            });
+          }
+          return layer;
+        }
+
+        // Pixel extent of one density bin on an axis, or null if the axis
+        // does not show it
+        function span(d, bin) {
+          var value = store.binValue(d, bin);
+          if (!_.isArray(value)) {
+            // an ordinal d3 scale would add an unknown value to its domain
+            if (_(y[d].domain()).indexOf(value) < 0) return null;
+            var at = y[d](value);
+            return [at - 1.5, at + 1.5];
+          }
+          return [y[d](value[1]), y[d](value[0])];
+        }
+
+        function stroke(i) {
+          if (layer === background) {
+            ctx.strokeStyle = $('body').hasClass('inverted') ? "#272727" : "#d4d4d4";
+            ctx.globalAlpha = 1;
+            ctx.lineWidth = 1;
+          } else {
+            ctx.strokeStyle = color(i) || "darkolivegreen";
+            ctx.globalAlpha = layer === foreground ? self.opacity() : 1;
+            ctx.lineWidth = 1.5;
+          }
+          ctx.stroke(new Path2D(path(i)));
+        }
+
+        layer.rows = function() {
+          return rows;
+        };
+
+        layer.attr = function(name, value) {
+          if (name == "d") layer.draw(rows);
+          if (name == "visibility") canvas.style.visibility = value || "";
+          return layer;
+        };
+
+        return layer;
+      }
+
+      // Find the line under the pointer: interpolate every foreground row
+      // between the two axes either side of it and pick the closest.
+      var pending = null;
+      function hitTest() {
+        var rect = container[0][0].getBoundingClientRect(),
+            mouse = [d3.event.clientX - rect.left, d3.event.clientY - rect.top];
+        if (pending) return;
+        pending = requestAnimationFrame(function() {
+          pending = null;
+          var mx = mouse[0] - m[3],
+              my = mouse[1] - m[0],
+              j = 0;
+          while (j < dimensions.length - 2 && position(dimensions[j + 1]) < mx) j++;
+          var a = dimensions[j], b = dimensions[j + 1];
+          if (!b || mx < position(a) || mx > position(b)) return hover(undefined);
+          var t = (mx - position(a)) / (position(b) - position(a)),
+              rows = foreground.rows(),
+              best, bestDist = 5;
+          for (var k = 0; k < rows.length; k++) {
+            var ya = y[a](store.axisValue(a, rows[k])),
+                yb = y[b](store.axisValue(b, rows[k])),
+                dist = Math.abs(ya + t * (yb - ya) - my);
+            if (dist < bestDist) { best = rows[k]; bestDist = dist; }
+          }
+          hover(best);
+        });
+      }
+
+      function hover(id) {
+        _(hovered).each(function(fn) { fn(id); });
+      }
+
       self.highlight = function(i) {
+        if (layered) {
+          var id = (model.get('filtered') || [])[i];
+          if (typeof i == "undefined" || typeof id == "undefined") {
+            foreground.canvas.style.opacity = "1";
+            layers.highlight.draw([]);
+          } else {
+            foreground.canvas.style.opacity = "0.35";
+            layers.highlight.draw([id]);
+          }
+          return;
+        }
         if (typeof i == "undefined") {
           d3.select("#parallel .foreground").style("opacity", function(d, j) {
             return "1";
@@ -193,14 +476,24 @@
                            .data([model.get('filtered')[i]])
                          .enter().append("svg:path")
                            .attr("d", path)
-                           .attr("style", function(d) {
-                             return "stroke:" + colors[d["GROUP"]] + ";";
+                           .attr("style", function(i) {
+                             return "stroke:" + color(i) + ";";
                            });
         }
       };
     }
-    
+
+    // Foreground line opacity for the canvas renderer (the SVG renderer
+    // uses the stroke-opacity in style.css)
+    var opacity = 0.2;
+    self.opacity = function(value) {
+      if (!arguments.length) return opacity;
+      opacity = +value;
+      if (renderer == 'canvas' && foreground) foreground.draw(lines(model.get('filtered') || myData));
+      return self;
+    };
+
     return self;
   };
-  
+
 })(d3);
@@ -1,6 +1,6 @@
 (function(d3) {
 
-  window.piegroups = function(data, keys, colors, group) {
+  window.piegroups = function(store, data, keys, colors, group) {
     var self = {};
 
     // var keys = _(data).chain().groupBy(group).keys().value();
@@ -11,14 +11,17 @@
         donut = d3.layout.pie().sort(null),
         arc = d3.svg.arc().innerRadius(r - 28).outerRadius(r - 6);
 
-    var svg = d3.select("#pie").append("svg:svg")
+    var root = d3.select("#pie").append("svg:svg")
         .attr("width", w)
-        .attr("height", h)
-      .append("svg:g")
+        .attr("height", h);
+
+    var svg = root.append("svg:g")
         .attr("transform", "translate(" + w / 2 + "," + h / 2 + ")");
 
+    var counts = store.countBy(group, data);
+
     var arcs = svg.selectAll("path")
-        .data(donut(count(data)))
+        .data(donut(ordered()))
       .enter().append("svg:path")
         .attr("fill", function(d, i) { return colors[keys[i]]; })
         .attr("d", arc)
@@ -27,20 +30,40 @@
         });
 
     self.update =  function(data) {
-      if (_.isEmpty(data)) return;
-      arcs = arcs.data(donut(count(data)));
-      arcs.attr("d", arc);
+      counts = store.countBy(group, data);
+      redraw();
     };
 
-    function count(data) {
-      var counts = {};
-      _(data)
-        .chain()
-        .groupBy(group)
-        .each(function(v,k) {
-          counts[k] = v.length;
-        });
+    // Adjust the counts by the rows that entered / left the filtered set,
+    // or take them as they are when the filter worker supplied them
+    self.patch = function(delta) {
+      if (delta.counts) {
+        counts = delta.counts;
+        return redraw();
+      }
+      _(delta.added).each(function(i) {
+        var k = store.value(group, i);
+        counts[k] = (counts[k] || 0) + 1;
+      });
+      _(delta.removed).each(function(i) {
+        counts[store.value(group, i)] -= 1;
+      });
+      redraw();
+    };
+
+    // Take the chart off the page (before drawing one for another grouping)
+    self.remove = function() {
+      root.remove();
+    };
+
+    function redraw() {
+      var values = ordered();
+      if (!_(values).any(function(v) { return v > 0; })) return;
+      arcs = arcs.data(donut(values));
+      arcs.attr("d", arc);
+    }
 
+    function ordered() {
       return _(keys).map(function(k) {
         if (k in counts) {
           return counts[k];
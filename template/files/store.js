@@ -0,0 +1,521 @@
+(function(root) {
+
+  // Column-oriented view of the data written by build.py.
+  //
+  // Numeric columns are held as Float64Arrays (missing values are NaN) and
+  // ordinal columns as Int32Array codes into a dictionary (`domain`). Text
+  // found in a numeric column is NaN there and kept by row id in its
+  // `text`, for the grid and export.
+  // Rows are addressed by their integer index, which never changes for the
+  // lifetime of the page.
+  //
+  // A sharded build allocates every column at its full `length` up front
+  // and fills it shard by shard (see append); only rows below `loaded`
+  // hold data.
+  root.ColumnStore = function(length, columns) {
+    var self = {},
+        byName = {},
+        listeners = [],
+        inSample = null;
+
+    _(columns).each(function(col) { byName[col.name] = col; });
+
+    self.length = length;
+    self.loaded = length;
+    self.names = _(columns).pluck('name');
+
+    // Build-time aggregates from files/stats.js (see ColumnStore.load);
+    // they describe every row, so they stand in for scans over all ids.
+    // While shards are still loading they keep the axes at their final
+    // extents, but counts are only taken from them once every row is in.
+    self.stats = null;
+
+    function whole(ids) {
+      return self.stats && ids.length == self.loaded;
+    }
+
+    self.column = function(name) {
+      return byName[name];
+    };
+
+    self.isOrdinal = function(name) {
+      return byName[name].type == 'ordinal';
+    };
+
+    // Raw value of a cell: a number for numeric columns, a string otherwise
+    self.value = function(name, i) {
+      var col = byName[name];
+      return col.type == 'ordinal' ? col.domain[col.codes[i]] : col.values[i];
+    };
+
+    // Value as drawn on its axis. Ordinal columns with too many values
+    // carry an `axis` from build.py that folds the rare ones into a single
+    // "Other" category; everything else is drawn as its raw value.
+    self.axisValue = function(name, i) {
+      var col = byName[name];
+      if (col.type != 'ordinal') return col.values[i];
+      return col.axis ? col.axis.domain[col.axis.codes[col.codes[i]]] : col.domain[col.codes[i]];
+    };
+
+    // Dictionary codes shown as one axis category
+    self.axisCodes = function(name, value) {
+      var col = byName[name];
+      if (!col.axis) {
+        var code = self.codeOf(name, value);
+        return code >= 0 ? [code] : [];
+      }
+      var category = _(col.axis.domain).indexOf(value),
+          codes = [];
+      for (var c = 0; c < col.axis.codes.length; c++) {
+        if (col.axis.codes[c] === category) codes.push(c);
+      }
+      return codes;
+    };
+
+    // Materialise one row as a plain object (for the grid, popups, export)
+    self.row = function(i) {
+      var row = {};
+      for (var c = 0; c < columns.length; c++) {
+        var col = columns[c];
+        if (col.type == 'ordinal') {
+          row[col.name] = col.domain[col.codes[i]];
+        } else {
+          var v = col.values[i];
+          if (v !== v) {
+            v = col.text && i in col.text ? col.text[i] : null;
+          } else if (col.values instanceof Float32Array) {
+            v = +v.toPrecision(7);  // hide float32 rounding noise (60.93, not 60.9300003)
+          }
+          row[col.name] = v;
+        }
+      }
+      return row;
+    };
+
+    // All loaded row ids, 0..loaded-1
+    self.ids = function() {
+      var ids = new Array(self.loaded);
+      for (var i = 0; i < self.loaded; i++) ids[i] = i;
+      return ids;
+    };
+
+    // Copy a shard {offset, length, columns} into the columns; `columns`
+    // holds the values or codes of each column, in column order. Indexes
+    // built so far do not cover the new rows and are rebuilt on next use.
+    self.append = function(chunk) {
+      for (var c = 0; c < columns.length; c++) {
+        var col = columns[c],
+            data = chunk.columns[c];
+        if (col.type == 'ordinal') {
+          col.codes.set(data, chunk.offset);
+        } else if (ArrayBuffer.isView(data)) {
+          col.values.set(data, chunk.offset);
+        } else {
+          for (var k = 0; k < data.length; k++) {
+            col.values[chunk.offset + k] = data[k] === null ? NaN : data[k];
+          }
+        }
+        delete col.order;
+        delete col.offsets;
+        delete col.bins;
+      }
+      self.loaded = Math.max(self.loaded, chunk.offset + chunk.length);
+      _(listeners).each(function(fn) { fn(chunk.offset, chunk.offset + chunk.length); });
+    };
+
+    // Call fn(from, to) after rows [from, to) are appended
+    self.appended = function(fn) {
+      listeners.push(fn);
+    };
+
+    // The rows [from, to) of every column, in the shape append() takes
+    self.slice = function(from, to) {
+      return {
+        offset: from,
+        length: to - from,
+        columns: _(columns).map(function(col) {
+          return (col.type == 'ordinal' ? col.codes : col.values).slice(from, to);
+        })
+      };
+    };
+
+    // [min, max] of a numeric column over the given rows, ignoring NaN
+    self.extent = function(name, ids) {
+      var values = byName[name].values;
+      if (whole(ids)) {
+        var stat = self.stats.columns[name];
+        if (!('min' in stat)) return [0, 0];
+        // float32 columns hold the rounded value, so round the extent too
+        return values instanceof Float32Array ?
+          [Math.fround(stat.min), Math.fround(stat.max)] : [stat.min, stat.max];
+      }
+      var min = Infinity,
+          max = -Infinity;
+      for (var k = 0; k < ids.length; k++) {
+        var v = values[ids[k]];
+        if (v < min) min = v;
+        if (v > max) max = v;
+      }
+      return min <= max ? [min, max] : [0, 0];
+    };
+
+    // Axis categories used by the given rows, in dictionary order
+    self.categories = function(name, ids) {
+      var col = byName[name],
+          domain = col.axis ? col.axis.domain : col.domain;
+      if (whole(ids)) return domain.slice();
+      var seen = new Uint8Array(domain.length);
+      if (col.axis) {
+        for (var k = 0; k < ids.length; k++) seen[col.axis.codes[col.codes[ids[k]]]] = 1;
+      } else {
+        for (var k = 0; k < ids.length; k++) seen[col.codes[ids[k]]] = 1;
+      }
+      return _(domain).filter(function(v, code) { return seen[code]; });
+    };
+
+    // Code of an ordinal value, or -1 if it is not in the dictionary
+    self.codeOf = function(name, value) {
+      var col = byName[name];
+      if (!col.lookup) {
+        col.lookup = {};
+        _(col.domain).each(function(v, code) { col.lookup[v] = code; });
+      }
+      return value in col.lookup ? col.lookup[value] : -1;
+    };
+
+    // Sorted index of a column, as written by `build.py --index` or built
+    // here on first use:
+    //   numeric: `order` holds the ids of all non-NaN rows sorted by value
+    //   ordinal: `order` holds row ids grouped by code, and the posting
+    //            list of code c is order[offsets[c] .. offsets[c+1])
+    self.index = function(name) {
+      var col = byName[name];
+      if (col.order) return col;
+
+      var loaded = self.loaded;
+      if (col.type == 'ordinal') {
+        var offsets = new Int32Array(col.domain.length + 1);
+        for (var i = 0; i < loaded; i++) offsets[col.codes[i] + 1]++;
+        for (var c = 0; c < col.domain.length; c++) offsets[c + 1] += offsets[c];
+        var next = offsets.slice(0, -1),
+            order = new Int32Array(loaded);
+        for (var i = 0; i < loaded; i++) order[next[col.codes[i]]++] = i;
+        col.offsets = offsets;
+        col.order = order;
+      } else {
+        var values = col.values,
+            order = new Int32Array(loaded),
+            k = 0;
+        for (var i = 0; i < loaded; i++) {
+          if (values[i] === values[i]) order[k++] = i;
+        }
+        col.order = order.subarray(0, k).sort(function(a, b) { return values[a] - values[b]; });
+      }
+      return col;
+    };
+
+    // The rows of `ids` that are in the build-time stratified sample
+    // (build.py --sample). Selections no larger than the sample, and builds
+    // without one, are returned whole.
+    self.sample = function(ids) {
+      var sample = self.stats && self.stats.sample;
+      if (!sample || ids.length <= sample.length) return ids;
+      if (!inSample) {
+        inSample = new Uint8Array(length);
+        for (var k = 0; k < sample.length; k++) inSample[sample[k]] = 1;
+      }
+      var rows = [];
+      for (var k = 0; k < ids.length; k++) {
+        if (inSample[ids[k]]) rows.push(ids[k]);
+      }
+      return rows;
+    };
+
+    // Density bin of every row on an axis, as binned by build.py for the
+    // density renderer: equal-width bins over the build-time min/max for
+    // numeric columns, the axis category for ordinal ones; -1 if missing
+    self.bins = function(name) {
+      var col = byName[name];
+      if (col.bins) return col.bins;
+      var bins = new Int32Array(length).fill(-1);
+      if (col.type == 'ordinal') {
+        for (var i = 0; i < self.loaded; i++) {
+          bins[i] = col.axis ? col.axis.codes[col.codes[i]] : col.codes[i];
+        }
+      } else {
+        var stat = self.stats.columns[name],
+            top = self.stats.density.bins - 1,
+            scale = stat.max > stat.min ? (top + 1) / (stat.max - stat.min) : 0;
+        for (var i = 0; i < self.loaded; i++) {
+          var v = col.values[i];
+          if (v === v) bins[i] = Math.max(0, Math.min(Math.floor((v - stat.min) * scale), top));
+        }
+      }
+      return col.bins = bins;
+    };
+
+    // Number of density bins on an axis
+    self.binCount = function(name) {
+      var col = byName[name];
+      if (col.type != 'ordinal') return self.stats.density.bins;
+      return (col.axis ? col.axis.domain : col.domain).length;
+    };
+
+    // What a density bin stands for: the axis category of an ordinal
+    // column, or the [low, high] value range of a numeric one
+    self.binValue = function(name, bin) {
+      var col = byName[name];
+      if (col.type == 'ordinal') return (col.axis ? col.axis.domain : col.domain)[bin];
+      var stat = self.stats.columns[name],
+          step = (stat.max - stat.min) / self.stats.density.bins;
+      return [stat.min + bin * step, stat.min + (bin + 1) * step];
+    };
+
+    // Rows of `ids` per (bin of a, bin of b) cell and per value of `group`,
+    // as {sizes: [bins of a, bins of b], counts: {group: [cell, count, ...]}}
+    // listing the non-empty cells, where cell i * (bins of b) + j stands for
+    // bins i and j. With more groups than stats.density.groups all rows
+    // are counted under '' and the tile has `total` set. Taken from the
+    // build-time tiles when `ids` is every row and `group` is the build's
+    // group column; null if the build wrote no tiles, or when an axis has
+    // more than stats.density.categories bins (build.py tiles neither).
+    var scratch = null;
+    self.density = function(a, b, ids, group) {
+      var density = self.stats && self.stats.density;
+      if (!density || Math.max(self.binCount(a), self.binCount(b)) > density.categories) return null;
+      if (ids.length == length && group == self.stats.group) {
+        var pair = _(density.pairs).find(function(p) { return p.axes[0] == a && p.axes[1] == b; });
+        if (pair) return pair;
+      }
+      var binsA = self.bins(a),
+          binsB = self.bins(b),
+          nb = self.binCount(b),
+          cells = self.binCount(a) * nb,
+          limit = density.groups,
+          col = byName[group],
+          ordinal = col && col.type == 'ordinal',
+          split = col && (!ordinal || col.domain.length <= limit),
+          slots = {},
+          keys = [],
+          size = (limit + 1) * cells;
+      // one block of cells per group slot, plus block `limit` for all rows;
+      // reused from call to call
+      if (!scratch || scratch.length < size) scratch = new Float64Array(size);
+      else scratch.fill(0, 0, size);
+      for (var k = 0; k < ids.length; k++) {
+        var i = ids[k], x = binsA[i], y = binsB[i];
+        if (x < 0 || y < 0) continue;
+        var cell = x * nb + y;
+        scratch[limit * cells + cell]++;
+        if (!split) continue;
+        var key = ordinal ? col.codes[i] : col.values[i],
+            slot = slots[key];
+        if (slot === undefined) {
+          if (keys.length == limit) {
+            split = false;
+            continue;
+          }
+          slot = slots[key] = keys.length;
+          keys.push(key);
+        }
+        scratch[slot * cells + cell]++;
+      }
+      var tile = { axes: [a, b], sizes: [self.binCount(a), nb], counts: {} };
+      if (split) {
+        _(keys).each(function(key, slot) {
+          tile.counts[ordinal ? col.domain[key] : key] = sparse(scratch, slot * cells, cells);
+        });
+      } else {
+        tile.counts[''] = sparse(scratch, limit * cells, cells);
+        tile.total = true;
+      }
+      return tile;
+    };
+
+    function sparse(cells, from, n) {
+      var out = [];
+      for (var c = 0; c < n; c++) {
+        if (cells[from + c]) out.push(c, cells[from + c]);
+      }
+      return out;
+    }
+
+    // Number of rows per value of `name`, as {value: count}
+    self.countBy = function(name, ids) {
+      var col = byName[name],
+          counts = {};
+      if (whole(ids) && self.loaded == length) {
+        var stat = self.stats.columns[name];
+        if (col.type == 'ordinal' && stat.counts) {
+          // build-time counts are by dictionary code
+          for (var c = 0; c < stat.counts.length; c++) counts[col.domain[c]] = stat.counts[c];
+          return counts;
+        }
+        if (name == self.stats.group && self.stats.groups) return _(counts).extend(self.stats.groups);
+        if (self.stats.groupings && name in self.stats.groupings) {
+          return _(counts).extend(self.stats.groupings[name]);
+        }
+      }
+      if (col.type == 'ordinal') {
+        var byCode = new Float64Array(col.domain.length);
+        for (var k = 0; k < ids.length; k++) byCode[col.codes[ids[k]]]++;
+        for (var c = 0; c < byCode.length; c++) {
+          if (byCode[c]) counts[col.domain[c]] = byCode[c];
+        }
+      } else {
+        for (var k = 0; k < ids.length; k++) {
+          var v = col.values[ids[k]];
+          counts[v] = (counts[v] || 0) + 1;
+        }
+      }
+      return counts;
+    };
+
+    // Equal-width histogram of a numeric column over all rows, as
+    // {min, max, bins}, or undefined without build-time stats
+    self.histogram = function(name) {
+      var stat = self.stats && self.stats.columns[name];
+      return stat && stat.bins && { min: stat.min, max: stat.max, bins: stat.bins };
+    };
+
+    return self;
+  };
+
+  // Build a store from the columnar payload:
+  //   {length: n, columns: [{name, type: 'numeric', values: [...]},
+  //                         {name, type: 'ordinal', domain: [...], codes: [...]}]}
+  // `values` / `codes` may already be typed arrays, in which case they are
+  // used as they are.
+  ColumnStore.fromColumns = function(payload) {
+    var columns = _(payload.columns).map(function(col) {
+      var order = col.order && (ArrayBuffer.isView(col.order) ? col.order : Int32Array.from(col.order));
+      if (col.type == 'ordinal') {
+        var codes = ArrayBuffer.isView(col.codes) ? col.codes : Int32Array.from(col.codes);
+        return { name: col.name, type: 'ordinal', domain: col.domain, codes: codes, axis: col.axis,
+                 order: order, offsets: col.offsets && Int32Array.from(col.offsets) };
+      }
+      if (ArrayBuffer.isView(col.values)) {
+        return { name: col.name, type: 'numeric', values: col.values, order: order, text: col.text };
+      }
+      var values = new Float64Array(payload.length);
+      for (var i = 0; i < values.length; i++) {
+        var v = col.values[i];
+        values[i] = v === null ? NaN : v;
+      }
+      return { name: col.name, type: 'numeric', values: values, order: order, text: col.text };
+    });
+    return ColumnStore(payload.length, columns);
+  };
+
+  var DTYPES = { int32: Int32Array, float32: Float32Array };
+
+  // Fetch a binary build: a JSON manifest plus one little-endian .bin file
+  // per column. Each ArrayBuffer is wrapped in a typed array without copying.
+  ColumnStore.fetch = function(url, callback) {
+    var base = url.replace(/[^\/]*$/, '');
+    fetch(url).then(function(response) {
+      return response.json();
+    }).then(function(manifest) {
+      return Promise.all(_(manifest.columns).map(function(col) {
+        var files = [col.file].concat(col.order ? [col.order] : []);
+        return Promise.all(_(files).map(function(file) {
+          return fetch(base + file).then(function(response) {
+            return response.arrayBuffer();
+          });
+        })).then(function(buffers) {
+          var data = new DTYPES[col.dtype](buffers[0], 0, manifest.length),
+              order = buffers[1] && new Int32Array(buffers[1]);
+          return col.type == 'ordinal' ?
+            { name: col.name, type: 'ordinal', domain: col.domain, codes: data, axis: col.axis,
+              order: order, offsets: col.offsets } :
+            { name: col.name, type: 'numeric', values: data, order: order, text: col.text };
+        });
+      })).then(function(columns) {
+        callback(ColumnStore.fromColumns({ length: manifest.length, columns: columns }));
+      });
+    });
+  };
+
+  // Build a store from the legacy row-per-object payload (`var dataJSON`),
+  // with the text cells of numeric columns from `var dataTexts`
+  ColumnStore.fromRows = function(rows, ordinals, texts) {
+    var names = _(rows[0] || {}).keys();
+    var columns = _(names).map(function(name) {
+      if (ordinals.indexOf(name) >= 0) {
+        var index = {},
+            domain = [],
+            codes = new Int32Array(rows.length);
+        for (var i = 0; i < rows.length; i++) {
+          var v = rows[i][name];
+          if (!(v in index)) {
+            index[v] = domain.length;
+            domain.push(v);
+          }
+          codes[i] = index[v];
+        }
+        return { name: name, type: 'ordinal', domain: domain, codes: codes };
+      }
+      var values = new Float64Array(rows.length);
+      for (var i = 0; i < rows.length; i++) {
+        var s = rows[i][name];
+        values[i] = s === '' || s === null ? NaN : +s;
+      }
+      return { name: name, type: 'numeric', values: values, text: texts && texts[name] };
+    });
+    return ColumnStore(rows.length, columns);
+  };
+
+  // Load a sharded build (`var dataShards`, see build.py --shard-rows).
+  // Every shard is a script that passes its rows to ColumnStore.chunk, so
+  // this works from file:// too. `callback` gets the store as soon as the
+  // first shard is in; each later shard is requested when the browser is
+  // idle and appended, which fires the store's `appended` listeners.
+  ColumnStore.stream = function(manifest, callback) {
+    var columns = _(manifest.columns).map(function(col) {
+      if (col.type == 'ordinal') {
+        return { name: col.name, type: 'ordinal', domain: col.domain, axis: col.axis,
+                 codes: new Int32Array(manifest.length) };
+      }
+      return { name: col.name, type: 'numeric', values: new Float64Array(manifest.length).fill(NaN),
+               text: col.text };
+    });
+    var store = ColumnStore(manifest.length, columns),
+        idle = root.requestIdleCallback || function(fn) { return setTimeout(fn, 1); },
+        next = 0;
+    store.loaded = 0;
+
+    ColumnStore.chunk = function(chunk) {
+      store.append(chunk);
+      if (next++ == 0) callback(store);
+      if (next < manifest.shards.length) idle(request);
+    };
+
+    function request() {
+      var script = document.createElement('script');
+      script.src = manifest.shards[next];
+      document.getElementsByTagName('head')[0].appendChild(script);
+    }
+
+    if (manifest.shards.length) request(); else callback(store);
+  };
+
+  // Hand `callback` the store for whichever payload data.js defined,
+  // with the aggregates from stats.js attached when the build wrote them
+  ColumnStore.load = function(done) {
+    var callback = function(store) {
+      store.stats = typeof dataStats != 'undefined' ? dataStats : null;
+      done(store);
+    };
+    if (typeof dataShards != 'undefined') {
+      ColumnStore.stream(dataShards, callback);
+    } else if (typeof dataManifest != 'undefined') {
+      ColumnStore.fetch(dataManifest, callback);
+    } else if (typeof dataColumns != 'undefined') {
+      callback(ColumnStore.fromColumns(dataColumns));
+    } else {
+      callback(ColumnStore.fromRows(dataJSON, typeof dataOrdinals != 'undefined' ? dataOrdinals : [],
+                                    typeof dataTexts != 'undefined' ? dataTexts : null));
+    }
+  };
+
+})(this);
@@ -0,0 +1,85 @@
+// Runs FilterEngine and the group aggregation off the UI thread.
+//
+// Messages in:
+//   {type: 'init', length, columns, group}  columns as ColumnStore columns
+//   {type: 'data', ids}                     Int32Array of the working set
+//   {type: 'append', chunk}                 rows loaded since, see ColumnStore.append
+//   {type: 'group', group}                  count by another column from now on
+//   {type: 'run', id, filter}               plain ranges, see engine.js
+// Messages out:
+//   {type: 'ready', groups}                 group values, in code order
+//   {type: 'result', id, changed, words, added, removed, counts}
+//
+// Result buffers are transferred, not copied.
+
+importScripts('underscore.js', 'store.js', 'bitset.js', 'engine.js');
+
+var store, engine, group, groupCodes, groupCount;
+
+onmessage = function(e) {
+  var msg = e.data;
+
+  if (msg.type == 'init') {
+    store = ColumnStore(msg.length, msg.columns);
+    engine = FilterEngine(store);
+    group = msg.group;
+    groupCodes = encodeGroups(group);
+  } else if (msg.type == 'data') {
+    engine.setData(msg.ids);
+  } else if (msg.type == 'append') {
+    store.append(msg.chunk);
+    engine.append();
+    groupCodes = encodeGroups(group);
+  } else if (msg.type == 'group') {
+    group = msg.group;
+    groupCodes = encodeGroups(group);
+  } else if (msg.type == 'run') {
+    run(msg);
+  }
+};
+
+function run(msg) {
+  var result = engine.run(msg.filter);
+  if (!result) {
+    postMessage({ type: 'result', id: msg.id, changed: false });
+    return;
+  }
+  var words = result.mask.words.slice(),
+      added = Int32Array.from(result.added),
+      removed = Int32Array.from(result.removed),
+      counts = new Float64Array(groupCount);
+  result.mask.each(function(i) { counts[groupCodes[i]]++; });
+
+  postMessage({
+    type: 'result', id: msg.id, changed: true,
+    words: words, added: added, removed: removed, counts: counts
+  }, [words.buffer, added.buffer, removed.buffer, counts.buffer]);
+}
+
+// Integer group code per row; numeric group columns get a dictionary in
+// order of first appearance
+function encodeGroups(name) {
+  var col = store.column(name);
+  if (!col) {
+    groupCount = 0;
+    postMessage({ type: 'ready', groups: [] });
+    return new Int32Array(store.length);
+  }
+  if (col.type == 'ordinal') {
+    groupCount = col.domain.length;
+    postMessage({ type: 'ready', groups: col.domain });
+    return col.codes;
+  }
+  var index = {}, groups = [], codes = new Int32Array(store.length);
+  for (var i = 0; i < store.length; i++) {
+    var v = col.values[i];
+    if (!(v in index)) {
+      index[v] = groups.length;
+      groups.push(String(v));
+    }
+    codes[i] = index[v];
+  }
+  groupCount = groups.length;
+  postMessage({ type: 'ready', groups: groups });
+  return codes;
+}
@@ -0,0 +1,36 @@
+"""Density tiles (build.py --renderer density). Run with `python -m pytest tests`."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import build
+
+HEADER = ['Group', 'Height', 'Ref', 'Load']
+ROWS   = [{'Group': f'g{i % 3}', 'Height': float(i % 40), 'Ref': f'ref{i}', 'Load': float(i % 7)}
+          for i in range(5000)]
+
+
+def tiles(*options):
+    view = build.parser.parse_args(['data.csv', 'Group', '--renderer', 'density', *options])
+    density = build.DensityCollector(view, HEADER, ['Group', 'Ref'])
+    for row in ROWS:
+        density.add(row, row['Group'])
+    return density.close(len(ROWS))
+
+
+def test_unbucketed_text_axis_gets_no_tiles():
+    for options in (['--max-categories', '0'], ['--format', 'rows']):
+        density = tiles(*options)
+        assert [pair['axes'] for pair in density['pairs']] == [['Group', 'Height']]
+
+
+def test_bucketed_text_axis_is_tiled_within_bounds():
+    density = tiles()
+    assert [pair['axes'] for pair in density['pairs']] == [['Group', 'Height'], ['Height', 'Ref'],
+                                                         ['Ref', 'Load']]
+    for pair in density['pairs']:
+        assert max(pair['sizes']) <= build.DENSITY_CATEGORIES
+        assert sorted(pair['counts']) == ['g0', 'g1', 'g2']
+        cells = [n for counts in pair['counts'].values() for n in counts[1::2]]
+        assert min(cells) > 0 and sum(cells) == len(ROWS)